@@ -2,7 +2,7 @@ from django.contrib import admin
 
 from tablib import Dataset
 
-from ..models import FormSubmission
+from ..models import FormSubmission, OutboxEmail
 from .base import BaseFormSubmissionAdmin
 from .views import FormExportWizardView
 
@@ -27,3 +27,17 @@ class FormSubmissionAdmin(BaseFormSubmissionAdmin):
 
 
 admin.site.register(FormSubmission, FormSubmissionAdmin)
+
+
+@admin.register(OutboxEmail)
+class OutboxEmailAdmin(admin.ModelAdmin):
+    date_hierarchy = 'created_at'
+    list_display = ['subject', 'form_name', 'status', 'attempts', 'next_attempt_at', 'sent_at']
+    list_filter = ['status', 'form_name']
+    search_fields = ['subject', 'to']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class AldrynForms(AppConfig):
     name = 'aldryn_forms'
     verbose_name = 'Aldryn forms'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,331 @@
+import copy
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import prefetch_related_objects
+from django.template import TemplateDoesNotExist
+from django.template.loader import select_template
+
+from .constants import (
+    ALDRYN_FORMS_MANIFEST_LOCK_POLL_INTERVAL, ALDRYN_FORMS_MANIFEST_LOCK_TIMEOUT, ALDRYN_FORMS_MANIFEST_LOCK_WAIT,
+    DEFAULT_ALDRYN_FORMS_FORM_CLASS_CACHE_SIZE, DEFAULT_ALDRYN_FORMS_MANIFEST_CACHE,
+    DEFAULT_ALDRYN_FORMS_MANIFEST_CACHE_TIMEOUT,
+)
+from .utils import DOWNCAST_SELECT_RELATED, prefetch_form_elements
+
+
+# Bump when the structure of FormManifest changes,
+# so that manifests pickled by older code are ignored.
+FORM_MANIFEST_FORMAT = 1
+FORM_MANIFEST_GENERATION_KEY = 'aldryn_forms:manifest:generation'
+
+
+FormClassCacheKey = namedtuple(
+    'FormClassCacheKey',
+    field_names=[
+        'form_plugin_id',
+        'language',
+        'changed_date',
+        'plugin_ids',
+        'generation',
+    ]
+)
+
+FormManifest = namedtuple(
+    'FormManifest',
+    field_names=[
+        'version',
+        'fields',
+    ]
+)
+
+
+class FormClassCache:
+    """
+    Thread-safe, size-bounded LRU cache of compiled form classes.
+
+    Keys are FormClassCacheKey instances. They carry the ids of the plugins
+    the form class was built from, so an entry can be dropped as soon as
+    any of them changes.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def max_size(self):
+        return getattr(settings, 'ALDRYN_FORMS_FORM_CLASS_CACHE_SIZE', DEFAULT_ALDRYN_FORMS_FORM_CLASS_CACHE_SIZE)
+
+    def get(self, key):
+        with self._lock:
+            try:
+                self._entries.move_to_end(key)
+            except KeyError:
+                return None
+            return self._entries[key][0]
+
+    def set(self, key, form_class):
+        max_size = self.max_size
+
+        if max_size <= 0:
+            return
+
+        with self._lock:
+            self._entries[key] = (form_class, frozenset(key.plugin_ids))
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, plugin_id):
+        with self._lock:
+            stale_keys = [key for key, (_, plugin_ids) in self._entries.items() if plugin_id in plugin_ids]
+
+            for key in stale_keys:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+form_class_cache = FormClassCache()
+
+
+class TemplateCache:
+    """
+    Cache of the templates selected for form elements.
+
+    Keys are the candidate template names, which for fields depend only on
+    the type of the form and of the field. Lookups which found none of
+    the candidates are cached too.
+    """
+
+    def __init__(self):
+        self._templates = {}
+
+    def select_template(self, template_names):
+        template_names = tuple(template_names)
+
+        try:
+            template = self._templates[template_names]
+        except KeyError:
+            try:
+                template = select_template(template_names)
+            except TemplateDoesNotExist:
+                template = None
+            self._templates[template_names] = template
+
+        if template is None:
+            raise TemplateDoesNotExist(', '.join(template_names))
+        return template
+
+    def clear(self):
+        self._templates.clear()
+
+    def __len__(self):
+        return len(self._templates)
+
+
+template_cache = TemplateCache()
+
+
+def get_form_class_cache_key(instance, generation=None):
+    """
+    Returns the key of the compiled form class of the given form plugin.
+
+    The key changes whenever a form element is added, removed, moved or saved,
+    and whenever the manifests are invalidated, e.g. on changes of options.
+    The form classes cached by every process go stale with the generation.
+    """
+    if generation is None:
+        generation = get_manifest_generation()
+
+    plugins = [instance] + list(instance.get_form_elements())
+    changed_date = max(plugin.changed_date for plugin in plugins)
+    return FormClassCacheKey(
+        form_plugin_id=instance.pk,
+        language=instance.language,
+        changed_date=changed_date,
+        plugin_ids=tuple(plugin.pk for plugin in plugins),
+        generation=generation,
+    )
+
+
+def get_manifest_cache():
+    return caches[getattr(settings, 'ALDRYN_FORMS_MANIFEST_CACHE', DEFAULT_ALDRYN_FORMS_MANIFEST_CACHE)]
+
+
+def get_manifest_generation():
+    cache = get_manifest_cache()
+    generation = cache.get(FORM_MANIFEST_GENERATION_KEY)
+
+    if generation is None:
+        cache.add(FORM_MANIFEST_GENERATION_KEY, 1, timeout=None)
+        generation = cache.get(FORM_MANIFEST_GENERATION_KEY, 1)
+    return generation
+
+
+def invalidate_form_manifests():
+    """
+    Invalidates the manifests of all forms.
+
+    Aliases and publishing make it impossible to tell which forms are affected
+    by a plugin change, so all manifests are versioned by a shared generation.
+    """
+    cache = get_manifest_cache()
+
+    try:
+        cache.incr(FORM_MANIFEST_GENERATION_KEY)
+    except ValueError:
+        # The generation is not set, either it never was or the cache was flushed.
+        cache.add(FORM_MANIFEST_GENERATION_KEY, 1, timeout=None)
+
+
+def get_form_manifest_cache_key(form_plugin_id, language, generation=None):
+    if generation is None:
+        generation = get_manifest_generation()
+
+    return 'aldryn_forms:manifest:{}:{}:{}:{}'.format(
+        FORM_MANIFEST_FORMAT,
+        generation,
+        form_plugin_id,
+        language,
+    )
+
+
+def _get_detached_plugin(instance):
+    # A copy of the plugin without references to the rest of the plugin tree,
+    # which would otherwise end up pickled with it.
+    detached = copy.copy(instance)
+    detached.__dict__.pop('_inst', None)
+    detached.child_plugin_instances = None
+    detached._state = copy.copy(instance._state)
+    detached._state.fields_cache = {
+        name: value for name, value in instance._state.fields_cache.items()
+        if name in DOWNCAST_SELECT_RELATED
+    }
+    return detached
+
+
+def build_form_manifest(instance, generation=None):
+    """
+    Returns the picklable manifest of the given form plugin.
+
+    The manifest holds everything needed to construct the form class:
+    the form fields with their plugin instances and options.
+    """
+    fields = instance.get_form_fields()
+    plugins_with_options = [field.plugin_instance for field in fields if hasattr(field.plugin_instance, 'option_set')]
+    prefetch_related_objects(plugins_with_options, 'option_set')
+    return FormManifest(
+        version=get_form_class_cache_key(instance, generation),
+        fields=[field._replace(plugin_instance=_get_detached_plugin(field.plugin_instance)) for field in fields],
+    )
+
+
+def store_form_manifest(instance, generation=None):
+    """
+    Builds the manifest of the given form plugin and stores it in the manifest cache.
+    """
+    if generation is None:
+        generation = get_manifest_generation()
+
+    manifest = build_form_manifest(instance, generation)
+    timeout = getattr(settings, 'ALDRYN_FORMS_MANIFEST_CACHE_TIMEOUT', DEFAULT_ALDRYN_FORMS_MANIFEST_CACHE_TIMEOUT)
+    cache_key = get_form_manifest_cache_key(instance.pk, instance.language, generation)
+    get_manifest_cache().set(cache_key, manifest, timeout=timeout)
+    return manifest
+
+
+def get_form_manifest(instance):
+    """
+    Returns the manifest of the given form plugin from the manifest cache.
+
+    Only one worker rebuilds a missing manifest, the others wait
+    for it instead of all loading the form from the database.
+    """
+    cache = get_manifest_cache()
+    generation = get_manifest_generation()
+    cache_key = get_form_manifest_cache_key(instance.pk, instance.language, generation)
+    manifest = cache.get(cache_key)
+
+    if manifest is not None and not is_form_manifest_stale(manifest, instance):
+        return manifest
+
+    lock_key = f'{cache_key}:lock'
+
+    if cache.add(lock_key, True, timeout=ALDRYN_FORMS_MANIFEST_LOCK_TIMEOUT):
+        try:
+            manifest = store_form_manifest(instance, generation)
+        finally:
+            cache.delete(lock_key)
+        return manifest
+
+    deadline = time.monotonic() + ALDRYN_FORMS_MANIFEST_LOCK_WAIT
+
+    while time.monotonic() < deadline:
+        time.sleep(ALDRYN_FORMS_MANIFEST_LOCK_POLL_INTERVAL)
+        manifest = cache.get(cache_key)
+
+        if manifest is not None and not is_form_manifest_stale(manifest, instance):
+            return manifest
+    # The worker holding the lock takes too long, don't wait any longer.
+    return build_form_manifest(instance, generation)
+
+
+def get_cached_form_manifest(instance):
+    """
+    Returns the manifest of the given form plugin if it is in the manifest cache, None otherwise.
+    """
+    cache_key = get_form_manifest_cache_key(instance.pk, instance.language)
+    manifest = get_manifest_cache().get(cache_key)
+
+    if manifest is None or is_form_manifest_stale(manifest, instance):
+        return None
+    return manifest
+
+
+def is_form_manifest_stale(manifest, instance):
+    """
+    Returns whether the given manifest was built from an older state of the given form plugin.
+
+    Only form plugins with their plugin tree loaded, e.g. by the CMS rendering
+    them, are checked. A manifest cache which isn't shared between processes
+    misses the invalidations of the other processes.
+    """
+    if instance.child_plugin_instances is None:
+        return False
+    return get_form_class_cache_key(instance, manifest.version.generation) != manifest.version
+
+
+def prefetch_form_manifests(form_plugins):
+    """
+    Builds and stores the missing manifests of the given form plugins.
+
+    The form elements of all forms without a manifest are loaded together.
+    Returns the manifests of all given form plugins, keyed by the plugin id.
+    """
+    generation = get_manifest_generation()
+    form_plugins_by_key = {
+        get_form_manifest_cache_key(plugin.pk, plugin.language, generation): plugin
+        for plugin in form_plugins
+    }
+    cached_manifests = {
+        key: manifest for key, manifest in get_manifest_cache().get_many(form_plugins_by_key.keys()).items()
+        if not is_form_manifest_stale(manifest, form_plugins_by_key[key])
+    }
+    manifests = {form_plugins_by_key[key].pk: manifest for key, manifest in cached_manifests.items()}
+    missing = [plugin for key, plugin in form_plugins_by_key.items() if key not in cached_manifests]
+    prefetch_form_elements(missing)
+
+    for plugin in missing:
+        manifests[plugin.pk] = store_form_manifest(plugin, generation)
+    return manifests
@@ -1,7 +1,6 @@
 import logging
 import re
-import smtplib
-from typing import Dict
+from typing import Dict, List, Optional
 
 from django import forms
 from django.apps import apps
@@ -10,7 +9,6 @@ from django.contrib import messages
 from django.contrib.admin import TabularInline
 from django.core.validators import MinLengthValidator
 from django.db.models import query
-from django.template.loader import select_template
 from django.utils.safestring import mark_safe
 from django.utils.translation import get_language, gettext
 from django.utils.translation import gettext_lazy as _
@@ -18,33 +16,62 @@ from django.utils.translation import gettext_lazy as _
 from cms.models.pluginmodel import CMSPlugin
 from cms.plugin_base import CMSPluginBase
 from cms.plugin_pool import plugin_pool
+from cms.utils.conf import get_cms_setting
 
 import markdown
-from emailit.api import send_mail
+from emailit.api import construct_mail
 from emailit.utils import get_template_names
 from filer.models import filemodels, imagemodels
 from PIL import Image
 
 from . import models
+from .cache import (
+    form_class_cache, get_cached_form_manifest, get_form_manifest, prefetch_form_manifests, template_cache,
+)
+from .constants import ALDRYN_FORMS_CSRF_TOKEN_MARKER, ALDRYN_FORMS_SUBMISSION_HEADER
 from .forms import (
     BooleanFieldForm, CaptchaFieldForm, DateFieldForm, DateTimeFieldForm, EmailFieldForm, FileFieldForm, FormPluginForm,
-    FormSubmissionBaseForm, HiddenFieldForm, ImageFieldForm, MultipleSelectFieldForm, RadioFieldForm,
-    RestrictedFileField, RestrictedImageField, RestrictedMultipleFilesField, SelectFieldForm, TextAreaFieldForm,
-    TextFieldForm, TimeFieldForm,
+    FormSubmissionBaseForm, HiddenFieldForm, ImageFieldForm, MultipleSelectFieldForm, OptionChoiceField,
+    OptionMultipleChoiceField, RadioFieldForm, RestrictedFileField, RestrictedImageField, RestrictedMultipleFilesField,
+    SelectFieldForm, TextAreaFieldForm, TextFieldForm, TimeFieldForm,
 )
 from .helpers import get_user_name
+from .mail import collect_messages, send_messages
 from .models import SerializedFormField
+from .rendering import FormRenderer, can_render_in_single_pass
 from .signals import form_post_save, form_pre_save
 from .sizefield.utils import filesizeformat
-from .utils import get_action_backends
+from .utils import (
+    get_action_backends, get_page_form_plugins, get_request_form_manifests, get_success_redirect_url,
+    is_cacheable_render, is_cacheable_render_enabled, is_success_redirect,
+)
 from .validators import MaxChoicesValidator, MinChoicesValidator, is_valid_recipient
 
 
 logger = logging.getLogger(__name__)
 
 
-class FormElement(CMSPluginBase):
-    # Don't cache anything.
+class CacheableRenderMixin:
+    """
+    Lets the CMS cache the rendered plugin when ALDRYN_FORMS_CACHEABLE_RENDER is enabled.
+
+    Form submissions are never served from the cache, the cache varies
+    on a header the CacheableForms middleware sets on POST requests.
+    """
+
+    def get_cache_expiration(self, request, instance, placeholder):
+        if is_cacheable_render(request):
+            return get_cms_setting('CACHE_DURATIONS')['content']
+        return super().get_cache_expiration(request, instance, placeholder)
+
+    def get_vary_cache_on(self, request, instance, placeholder):
+        if is_cacheable_render_enabled():
+            return [ALDRYN_FORMS_SUBMISSION_HEADER]
+        return super().get_vary_cache_on(request, instance, placeholder)
+
+
+class FormElement(CacheableRenderMixin, CMSPluginBase):
+    # Don't cache anything, unless ALDRYN_FORMS_CACHEABLE_RENDER is enabled.
     cache = False
     module = _('Forms')
 
@@ -89,17 +116,60 @@ class FormPlugin(FieldContainer):
         context = super().render(context, instance, placeholder)
         request = context['request']
 
+        # The CMS passes the slot of the placeholder, not the placeholder with its plugins.
+        self.prefetch_page_forms(instance, request, instance.placeholder)
         form = self.process_form(instance, request)
 
         if request.POST.get('form_plugin_id') == str(instance.id) and form.is_valid():
             context['post_success'] = True
             context['form_success_url'] = self.get_success_url(instance)
+            # The HandleHttpPost middleware replaces the rendered page by a redirect.
+            request._aldryn_forms_success_redirect_url = get_success_redirect_url(
+                request, instance, context['form_success_url'])
+        elif is_success_redirect(request, instance):
+            context['post_success'] = True
+        if is_cacheable_render(request):
+            # The token is filled in for each response by the CacheableForms middleware.
+            context['csrf_token'] = ALDRYN_FORMS_CSRF_TOKEN_MARKER
+        if can_render_in_single_pass(request):
+            context['form_renderer'] = FormRenderer()
         context['form'] = form
         return context
 
     def get_render_template(self, context, instance, placeholder):
         return instance.form_template
 
+    def prefetch_page_forms(self, instance, request, placeholder=None):
+        """
+        Builds the manifests of all forms on the current page together,
+        when the first form without a manifest is rendered.
+
+        Manifests are invalidated all at once, so the other forms
+        on the page are very likely missing theirs too. The manifests
+        are kept on the request, the form classes are built from them
+        without fetching them from the cache again.
+        """
+        manifests = get_request_form_manifests(request)
+
+        if instance.pk in manifests:
+            return
+
+        manifest = get_cached_form_manifest(instance)
+
+        if manifest is not None:
+            manifests[instance.pk] = manifest
+            return
+
+        if getattr(request, '_aldryn_forms_page_prefetched', False):
+            return
+
+        request._aldryn_forms_page_prefetched = True
+        form_plugins = get_page_form_plugins(request, placeholder)
+
+        if instance.pk not in {plugin.pk for plugin in form_plugins}:
+            form_plugins.append(instance)
+        manifests.update(prefetch_form_manifests(form_plugins))
+
     def form_valid(self, instance, request, form):
         action_backend = get_action_backends()[form.form_plugin.action_backend]()
         return action_backend.form_valid(self, instance, request, form)
@@ -109,7 +179,34 @@ class FormPlugin(FieldContainer):
             form._add_error(message=instance.error_message)
 
     def process_form(self, instance, request):
-        form_class = self.get_form_class(instance)
+        """
+        Returns the form of the given form plugin, bound to the request when it was submitted.
+
+        A submitted form is processed once per request, the middleware or view
+        handling the submission and the rendering of the page share the result.
+        """
+        if request.POST.get('form_plugin_id') != str(instance.id):
+            return self.get_unbound_form(instance, request)
+
+        processed_forms = getattr(request, '_aldryn_forms_processed_forms', None)
+
+        if processed_forms is None:
+            processed_forms = request._aldryn_forms_processed_forms = {}
+
+        if instance.pk not in processed_forms:
+            processed_forms[instance.pk] = self._process_form(instance, request)
+        return processed_forms[instance.pk]
+
+    def get_unbound_form(self, instance, request):
+        """
+        Returns the form of a form plugin the request didn't submit,
+        without binding or validating it.
+        """
+        form_class = self.get_form_class(instance, self.get_request_form_manifest(instance, request))
+        return form_class(**self.get_form_kwargs(instance, request))
+
+    def _process_form(self, instance, request):
+        form_class = self.get_form_class(instance, self.get_request_form_manifest(instance, request))
         form_kwargs = self.get_form_kwargs(instance, request)
         form = form_class(**form_kwargs)
 
@@ -137,42 +234,68 @@ class FormPlugin(FieldContainer):
                 form=form,
                 request=request,
             )
-
-            self.form_valid(instance, request, form)
-
-            # post save field hooks
-            for field in fields:
-                field._plugin_instance.form_post_save(
-                    instance=field._model_instance,
+            # The pre save hooks replace uploaded files by their filer files.
+            form.reset_serialized_fields()
+
+            # All emails of the submission are sent together.
+            with collect_messages(form_name=instance.name):
+                self.form_valid(instance, request, form)
+
+                # post save field hooks
+                for field in fields:
+                    field._plugin_instance.form_post_save(
+                        instance=field._model_instance,
+                        form=form,
+                        request=request,
+                    )
+
+                form_post_save.send(
+                    sender=models.FormPlugin,
+                    instance=instance,
                     form=form,
                     request=request,
                 )
-
-            form_post_save.send(
-                sender=models.FormPlugin,
-                instance=instance,
-                form=form,
-                request=request,
-            )
         elif request.POST.get('form_plugin_id') == str(instance.id) and request.method == 'POST':
             # only call form_invalid if request is POST and form is not valid
             self.form_invalid(instance, request, form)
         return form
 
-    def get_form_class(self, instance):
+    def get_request_form_manifest(self, instance, request):
+        """
+        Returns the manifest of the given form plugin, fetched once per request.
+        """
+        manifests = get_request_form_manifests(request)
+
+        if instance.pk not in manifests:
+            manifests[instance.pk] = get_form_manifest(instance)
+        return manifests[instance.pk]
+
+    def get_form_class(self, instance, manifest=None):
         """
         Constructs form class basing on children plugin instances.
+
+        The class is built from the given form manifest, or the one shared
+        through the cache. Form classes are cached per form version, only
+        the form instance is bound to the request.
         """
-        fields = self.get_form_fields(instance)
-        formClass = (
-            type(FormSubmissionBaseForm)
-            ('AldrynDynamicForm', (FormSubmissionBaseForm,), fields)
-        )
+        if manifest is None:
+            manifest = get_form_manifest(instance)
+        formClass = form_class_cache.get(manifest.version)
+
+        if formClass is None:
+            fields = self.get_form_fields(instance, fields=manifest.fields)
+            formClass = (
+                type(FormSubmissionBaseForm)
+                ('AldrynDynamicForm', (FormSubmissionBaseForm,), fields)
+            )
+            form_class_cache.set(manifest.version, formClass)
         return formClass
 
-    def get_form_fields(self, instance: models.FormPlugin) -> Dict:
+    def get_form_fields(self, instance: models.FormPlugin, fields: Optional[List[models.FormField]] = None) -> Dict:
         form_fields = {}
-        fields = instance.get_form_fields()
+
+        if fields is None:
+            fields = instance.get_form_fields()
 
         for field in fields:
             plugin_instance = field.plugin_instance
@@ -206,11 +329,21 @@ class FormPlugin(FieldContainer):
             messages.success(request, mark_safe(message))
 
     def send_notifications(self, instance, form):
+        """
+        Sends the notification of the submission to the recipients of the form.
+
+        Returns the intended recipients. The email is sent together with the
+        other emails of the submission once it is saved, sending errors are
+        logged then.
+        """
         users = instance.recipients.exclude(email='')
 
         recipients = [user for user in users.iterator()
                       if is_valid_recipient(user.email)]
 
+        if not recipients:
+            return []
+
         context = {
             'form_name': instance.name,
             'form_data': form.get_serialized_field_choices(),
@@ -233,18 +366,15 @@ class FormPlugin(FieldContainer):
         else:
             subject_templates = None
 
-        try:
-            send_mail(
-                recipients=[user.email for user in recipients],
-                context=context,
-                template_base=getattr(
-                    settings, 'ALDRYN_FORMS_EMAIL_TEMPLATES_BASE', 'aldryn_forms/emails/notification'),
-                subject_templates=subject_templates,
-                language=instance.language,
-                reply_to=reply_to,
-            )
-        except smtplib.SMTPException as err:
-            logger.error(err)
+        send_messages([construct_mail(
+            recipients=[user.email for user in recipients],
+            context=context,
+            template_base=getattr(
+                settings, 'ALDRYN_FORMS_EMAIL_TEMPLATES_BASE', 'aldryn_forms/emails/notification'),
+            subject_templates=subject_templates,
+            language=instance.language,
+            reply_to=reply_to,
+        )], form_name=instance.name)
 
         users_notified = [
             (get_user_name(user), user.email) for user in recipients]
@@ -278,7 +408,7 @@ class Fieldset(FieldContainer):
             # unfortunately, there's no builtin way to enforce this on the cms
             form_plugin = None
         templates = self.get_template_names(instance, form_plugin)
-        return select_template(templates)
+        return template_cache.select_template(templates)
 
     def get_template_names(self, instance, form_plugin=None):
         template_names = ['aldryn_forms/fieldset.html']
@@ -419,7 +549,7 @@ class Field(FormElement):
             # unfortunately, there's no builtin way to enforce this on the cms
             form_plugin = None
         templates = self.get_template_names(instance, form_plugin)
-        return select_template(templates)
+        return template_cache.select_template(templates)
 
     def get_fieldsets(self, request, obj=None):
         if self.fieldsets or self.fields:
@@ -676,20 +806,21 @@ class EmailField(BaseTextField):
     email_template_base = 'aldryn_forms/emails/user/notification'
 
     def send_notification_email(self, email, form, form_field_instance):
+        """
+        Sends the confirmation to the email entered in the field, together with
+        the other emails of the submission once it is saved.
+        """
         context = {
             'form_name': form.instance.name,
             'form_data': form.get_serialized_field_choices(is_confirmation=True),
             'body_text': form_field_instance.email_body,
         }
-        try:
-            send_mail(
-                recipients=[email],
-                context=context,
-                subject=form_field_instance.email_subject,
-                template_base=self.email_template_base
-            )
-        except smtplib.SMTPException as err:
-            logger.error(err)
+        send_messages([construct_mail(
+            recipients=[email],
+            context=context,
+            subject=form_field_instance.email_subject,
+            template_base=self.email_template_base
+        )], form_name=form.form_plugin.name)
 
     def form_post_save(self, instance, form, **kwargs):
         field_name = form.form_plugin.get_form_field_name(field=instance)
@@ -747,13 +878,35 @@ class FileField(Field):
             kwargs['accepted_types'] = re.split(r"\s+", instance.accepted_types)
         return kwargs
 
-    def serialize_value(self, instance, value, is_confirmation=False):
+    def serialize_value(self, instance, value, is_confirmation=False, request=None):
         links = []
         for item in value:
-            if item:
-                links.append(item.original_filename if is_confirmation else item.absolute_uri)
+            if not item:
+                continue
+
+            if is_confirmation:
+                links.append(item.original_filename)
+            elif request is not None:
+                links.append(request.build_absolute_uri(item.url))
+            else:
+                links.append(item.url)
         return "\n".join(links)
 
+    def serialize_field(self, form, field, is_confirmation=False):
+        # The links to the uploaded files are absolute URLs of the submitting request.
+        value = self.serialize_value(
+            instance=field.plugin_instance,
+            value=form.cleaned_data[field.name],
+            is_confirmation=is_confirmation,
+            request=form.request,
+        )
+        return SerializedFormField(
+            name=field.name,
+            label=field.label,
+            field_occurrence=field.field_occurrence,
+            value=value,
+        )
+
     def form_pre_save(self, instance, form, **kwargs):
         """Save the uploaded file to django-filer
 
@@ -785,11 +938,6 @@ class FileField(Field):
                 is_public=True,
             )
             filer_file.save()
-
-            # NOTE: This is a hack to make the full URL available later when we
-            # need to serialize this field. We avoid to serialize it here directly
-            # as we could still need access to the original filer File instance.
-            filer_file.absolute_uri = request.build_absolute_uri(filer_file.url)
             filer_file_instances.append(filer_file)
 
         form.cleaned_data[field_name] = filer_file_instances
@@ -899,8 +1047,8 @@ class SelectField(Field):
     name = _('Select Field')
 
     form = SelectFieldForm
-    form_field = forms.ModelChoiceField
-    form_field_widget = form_field.widget
+    form_field = OptionChoiceField
+    form_field_widget = forms.Select
     form_field_enabled_options = [
         'label',
         'name',
@@ -923,8 +1071,9 @@ class SelectField(Field):
 
     def get_form_field_kwargs(self, instance):
         kwargs = super().get_form_field_kwargs(instance)
-        kwargs['queryset'] = instance.option_set.all()
-        for opt in kwargs['queryset']:
+        # Uses the options prefetched with the form.
+        kwargs['options'] = list(instance.option_set.all())
+        for opt in kwargs['options']:
             if opt.default_value:
                 kwargs['initial'] = opt.pk
                 break
@@ -935,7 +1084,7 @@ class MultipleSelectField(SelectField):
     name = _('Multiple Select Field')
 
     form = MultipleSelectFieldForm
-    form_field = forms.ModelMultipleChoiceField
+    form_field = OptionMultipleChoiceField
     form_field_widget = forms.CheckboxSelectMultiple
     form_field_enabled_options = [
         'label',
@@ -966,9 +1115,13 @@ class MultipleSelectField(SelectField):
         if hasattr(instance, 'min_value') and instance.min_value == 0:
             kwargs['required'] = False
 
-        kwargs['initial'] = [o.pk for o in kwargs['queryset'] if o.default_value]
+        kwargs['initial'] = [o.pk for o in kwargs['options'] if o.default_value]
         return kwargs
 
+    def serialize_value(self, instance, value, is_confirmation=False):
+        # The chosen options are cleaned into a list.
+        return ', '.join(map(str, value))
+
 
 class MultipleCheckboxSelectField(MultipleSelectField):
     name = _('Multiple Checkbox Field')
@@ -978,7 +1131,7 @@ class RadioSelectField(Field):
     name = _('Radio Select Field')
 
     form = RadioFieldForm
-    form_field = forms.ModelChoiceField
+    form_field = OptionChoiceField
     form_field_widget = forms.RadioSelect
     form_field_enabled_options = [
         'label',
@@ -1002,9 +1155,9 @@ class RadioSelectField(Field):
 
     def get_form_field_kwargs(self, instance):
         kwargs = super().get_form_field_kwargs(instance)
-        kwargs['queryset'] = instance.option_set.all()
+        kwargs['options'] = list(instance.option_set.all())
         kwargs['empty_label'] = None
-        for opt in kwargs['queryset']:
+        for opt in kwargs['options']:
             if opt.default_value:
                 kwargs['initial'] = opt.pk
                 break
@@ -1046,7 +1199,7 @@ class SubmitButton(FormElement):
 
 
 @plugin_pool.register_plugin
-class HideContentWhenPostPlugin(CMSPluginBase):
+class HideContentWhenPostPlugin(CacheableRenderMixin, CMSPluginBase):
     module = _('Forms')
     name = _("Hide content after submitting a form")
     model = CMSPlugin
@@ -1056,7 +1209,8 @@ class HideContentWhenPostPlugin(CMSPluginBase):
 
     def render(self, context, instance, placeholder):
         context = super().render(context, instance, placeholder)
-        context['display_content'] = context['request'].method != "POST"
+        request = context['request']
+        context['display_content'] = request.method != "POST" and not is_success_redirect(request)
         return context
 
 
@@ -12,3 +12,23 @@ try:
     from cms.utils.plugins import build_plugin_tree
 except ImportError:
     from cms.utils.plugins import get_plugins_as_layered_tree as build_plugin_tree  # noqa
+
+from cms.models import CMSPlugin
+
+
+# django CMS 4 dropped the treebeard materialized path from CMSPlugin.
+# Plugins are then ordered by their position within the placeholder.
+CMS_PLUGIN_TREE_ORDERING = 'path' if hasattr(CMSPlugin, 'path') else 'position'
+
+try:
+    from cms.signals import post_publish, post_unpublish
+except ImportError:
+    # django CMS 4 leaves publishing to djangocms-versioning
+    post_publish = post_unpublish = None
+
+try:
+    from cms.models import PageContent
+except ImportError:
+    # django CMS 3 keeps a draft and a public copy of every page
+    # and its placeholders.
+    PageContent = None
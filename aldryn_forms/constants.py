@@ -4,3 +4,34 @@ DEFAULT_ALDRYN_FORMS_ACTION_BACKENDS = {
     'none': 'aldryn_forms.action_backends.NoAction',
 }
 ALDRYN_FORMS_ACTION_BACKEND_KEY_MAX_SIZE = 15
+DEFAULT_ALDRYN_FORMS_FORM_CLASS_CACHE_SIZE = 128
+DEFAULT_ALDRYN_FORMS_MANIFEST_CACHE = 'default'
+DEFAULT_ALDRYN_FORMS_MANIFEST_CACHE_TIMEOUT = 60 * 60 * 24
+# Single-flight protection of the manifest rebuild.
+ALDRYN_FORMS_MANIFEST_LOCK_TIMEOUT = 30
+ALDRYN_FORMS_MANIFEST_LOCK_WAIT = 5
+ALDRYN_FORMS_MANIFEST_LOCK_POLL_INTERVAL = 0.05
+# Requests the HandleHttpPost middleware looks at for form submissions.
+ALDRYN_FORMS_POST_CONTENT_TYPES = ('application/x-www-form-urlencoded', 'multipart/form-data')
+DEFAULT_ALDRYN_FORMS_HANDLE_POST_PATHS = None
+DEFAULT_ALDRYN_FORMS_HANDLE_POST_EXCLUDED_PATHS = ()
+DEFAULT_ALDRYN_FORMS_CACHEABLE_RENDER = False
+# Stands in for the CSRF token in cacheable form HTML, see the CacheableForms middleware.
+ALDRYN_FORMS_CSRF_TOKEN_MARKER = 'aldryn-forms-csrf-token-marker'
+# Cached form HTML varies on this request header, which is only set on submissions and the pages they redirect to.
+ALDRYN_FORMS_SUBMISSION_HEADER = 'X-Aldryn-Forms-Submission'
+# Query parameter marking the page a successful submission without a success URL is redirected to.
+ALDRYN_FORMS_SUCCESS_PARAM = 'aldryn_forms_success'
+DEFAULT_ALDRYN_FORMS_SINGLE_PASS_RENDER = False
+DEFAULT_ALDRYN_FORMS_DEFERRED_SENDING = False
+DEFAULT_ALDRYN_FORMS_DEFERRED_SENDING_WORKERS = 2
+DEFAULT_ALDRYN_FORMS_DEFERRED_SENDING_RETRIES = 3
+# Seconds before the first retry of a deferred send, doubled for every further retry.
+ALDRYN_FORMS_DEFERRED_SENDING_RETRY_DELAY = 1
+DEFAULT_ALDRYN_FORMS_EMAIL_OUTBOX = False
+# Seconds before the first retry of an outbox email, doubled for every further retry.
+ALDRYN_FORMS_EMAIL_OUTBOX_RETRY_DELAY = 60
+# Seconds the emails of a batch are reserved for the command sending them.
+ALDRYN_FORMS_EMAIL_OUTBOX_CLAIM_TIMEOUT = 10 * 60
+DEFAULT_ALDRYN_FORMS_SMTP_POOL_SIZE = 0
+DEFAULT_ALDRYN_FORMS_SMTP_POOL_IDLE_TIMEOUT = 30
@@ -3,13 +3,13 @@ from email.utils import parseaddr
 from typing import List
 
 from django.contrib import admin
-from django.core.mail import get_connection
 from django.template.defaultfilters import safe
 from django.utils.translation import gettext_lazy as _
 
 from cms.plugin_pool import plugin_pool
 
 from aldryn_forms.cms_plugins import FormPlugin
+from aldryn_forms.mail import send_messages
 from aldryn_forms.validators import is_valid_recipient
 
 from .models import EmailNotification, EmailNotificationFormPlugin
@@ -169,15 +169,13 @@ class EmailNotificationForm(FormPlugin):
         return inlines
 
     def send_notifications(self, instance, form):
-        try:
-            connection = get_connection(fail_silently=False)
-            connection.open()
-        except Exception as msg:
-            # I use a "catch all" in order to not couple this handler to a specific email backend
-            # different email backends have different exceptions.
-            logger.exception(f"Could not send notification emails. {msg}")
-            return []
+        """
+        Sends the email notifications of the form.
 
+        Returns the intended recipients. The emails are sent together with the
+        other emails of the submission once it is saved, sending errors are
+        logged then.
+        """
         notifications = instance.email_notifications.select_related('form')
 
         emails = []
@@ -192,12 +190,7 @@ class EmailNotificationForm(FormPlugin):
                 emails.append(email)
                 recipients.append(parseaddr(to_email))
 
-        try:
-            connection.send_messages(emails)
-        except Exception as msg:
-            # again, we catch all exceptions to be backend agnostic
-            logger.exception(f"Could not send notification emails. {msg}")
-            recipients = []
+        send_messages(emails, form_name=instance.name)
         return recipients
 
 
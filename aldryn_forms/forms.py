@@ -7,6 +7,7 @@ from django.core.exceptions import ValidationError
 from django.forms.forms import NON_FIELD_ERRORS
 from django.forms.utils import ErrorDict
 from django.forms.widgets import ClearableFileInput
+from django.utils.functional import cached_property
 from django.utils.module_loading import import_string
 from django.utils.translation import gettext
 from django.utils.translation import gettext_lazy as _
@@ -14,7 +15,7 @@ from django.utils.translation import gettext_lazy as _
 from easy_thumbnails.VIL import Image as VILImage
 from PIL import Image
 
-from .models import FormPlugin, FormSubmission
+from .models import FormPlugin, FormSubmission, Option
 from .sizefield.utils import filesizeformat
 from .utils import add_form_error, get_action_backends, get_user_model
 
@@ -219,6 +220,118 @@ class RestrictedImageField(FileSizeCheckMixin, forms.ImageField):
         return new_data
 
 
+class OptionChoiceField(forms.ChoiceField):
+    """
+    Choice of one option of a select field plugin.
+
+    Behaves like a ModelChoiceField over the options, but validates
+    against the options it was built with, without database queries.
+    """
+
+    default_error_messages = {
+        'invalid_choice': forms.ModelChoiceField.default_error_messages['invalid_choice'],
+    }
+
+    def __init__(self, options, empty_label='---------', **kwargs):
+        super().__init__(**kwargs)
+        # Options are keyed by their primary key as submitted.
+        self.options = {str(option.pk): option for option in options}
+
+        choices = [(option.pk, str(option)) for option in self.options.values()]
+        if empty_label is not None and not (self.required and self.initial is not None):
+            choices.insert(0, ('', empty_label))
+        self.choices = choices
+
+    def prepare_value(self, value):
+        if isinstance(value, Option):
+            return value.pk
+        return super().prepare_value(value)
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+
+        try:
+            return self.options[str(self.prepare_value(value))]
+        except KeyError:
+            raise ValidationError(
+                self.error_messages['invalid_choice'],
+                code='invalid_choice',
+                params={'value': value},
+            )
+
+    def validate(self, value):
+        forms.Field.validate(self, value)
+
+    def has_changed(self, initial, data):
+        if self.disabled:
+            return False
+        initial_value = initial if initial is not None else ''
+        data_value = data if data is not None else ''
+        return str(self.prepare_value(initial_value)) != str(data_value)
+
+
+class OptionMultipleChoiceField(forms.MultipleChoiceField):
+    """
+    Choice of several options of a select field plugin.
+
+    Behaves like a ModelMultipleChoiceField over the options, but validates
+    against the options it was built with, without database queries.
+    The chosen options are cleaned into a list in the order of the options.
+    """
+
+    default_error_messages = forms.ModelMultipleChoiceField.default_error_messages
+
+    def __init__(self, options, **kwargs):
+        super().__init__(**kwargs)
+        self.options = {str(option.pk): option for option in options}
+        self.choices = [(option.pk, str(option)) for option in self.options.values()]
+
+    def prepare_value(self, value):
+        if hasattr(value, '__iter__') and not isinstance(value, str):
+            return [option.pk if isinstance(option, Option) else option for option in value]
+        return super().prepare_value(value)
+
+    def clean(self, value):
+        value = self.prepare_value(value)
+
+        if self.required and not value:
+            raise ValidationError(self.error_messages['required'], code='required')
+        elif not self.required and not value:
+            return []
+        if not isinstance(value, (list, tuple)):
+            raise ValidationError(self.error_messages['invalid_list'], code='invalid_list')
+
+        for pk in value:
+            try:
+                int(pk)
+            except (ValueError, TypeError):
+                raise ValidationError(
+                    self.error_messages['invalid_pk_value'],
+                    code='invalid_pk_value',
+                    params={'pk': pk},
+                )
+            if str(pk) not in self.options:
+                raise ValidationError(
+                    self.error_messages['invalid_choice'],
+                    code='invalid_choice',
+                    params={'value': pk},
+                )
+
+        self.run_validators(value)
+        chosen = {str(pk) for pk in value}
+        return [option for pk, option in self.options.items() if pk in chosen]
+
+    def has_changed(self, initial, data):
+        if self.disabled:
+            return False
+        initial = [] if initial is None else initial
+        data = [] if data is None else data
+        if len(initial) != len(data):
+            return True
+        return {str(value) for value in self.prepare_value(initial)} != {str(value) for value in data}
+
+
 class DummyChecker:
     # https://gitlab.nic.cz/websites/django-cms-qe/-/blob/master/cms_qe_auth/utils.py#L47
 
@@ -260,16 +373,22 @@ class FormSubmissionBaseForm(forms.Form):
         self.form_plugin = kwargs.pop('form_plugin')
         self.request = kwargs.pop('request')
         super().__init__(*args, **kwargs)
-        language = self.form_plugin.language
-        self.email_availability_checker_class = get_email_availability_checker_class()
+        self._serialized_fields = {}
+        self.fields['language'].initial = self.form_plugin.language
+        self.fields['form_plugin_id'].initial = self.form_plugin.pk
 
-        self.instance = FormSubmission(
+    # Only submitted forms need these, most forms are just rendered.
+    @cached_property
+    def email_availability_checker_class(self):
+        return get_email_availability_checker_class()
+
+    @cached_property
+    def instance(self):
+        return FormSubmission(
             name=self.form_plugin.name,
-            language=language,
+            language=self.form_plugin.language,
             form_url=self.request.build_absolute_uri(self.request.path),
         )
-        self.fields['language'].initial = language
-        self.fields['form_plugin_id'].initial = self.form_plugin.pk
 
     def _add_error(self, message, field=NON_FIELD_ERRORS):
         try:
@@ -279,12 +398,29 @@ class FormSubmissionBaseForm(forms.Form):
                 self._errors = ErrorDict()
             self._errors[field] = self.error_class([message])
 
+    def full_clean(self):
+        self.reset_serialized_fields()
+        super().full_clean()
+
+    def reset_serialized_fields(self):
+        """
+        Drops the serialized fields, to be called when the cleaned data changes.
+        """
+        self._serialized_fields = {}
+
     def get_serialized_fields(self, is_confirmation=False):
         """
         The `is_confirmation` flag indicates if the data will be used in a
         confirmation email sent to the user submitting the form or if it will be
         used to render the data for the recipients/admin site.
+
+        The fields are serialized once for each flag and shared by all callers.
         """
+        if is_confirmation not in self._serialized_fields:
+            self._serialized_fields[is_confirmation] = list(self._serialize_fields(is_confirmation))
+        return list(self._serialized_fields[is_confirmation])
+
+    def _serialize_fields(self, is_confirmation):
         for field in self.form_plugin.get_form_fields():
             plugin = field.plugin_instance.get_plugin_class_instance()
             # serialize_field can be None or SerializedFormField  namedtuple instance.
@@ -1,4 +1,84 @@
+from collections import namedtuple
+
 from cms.cms_plugins import AliasPlugin
+from cms.plugin_pool import plugin_pool
+
+
+PluginRole = namedtuple(
+    'PluginRole',
+    field_names=[
+        'plugin_class',
+        'model',
+        'is_form_element',
+        'is_form',
+        'is_field',
+        'is_container',
+        'is_submit_button',
+        'is_alias',
+    ]
+)
+
+
+class PluginRoles:
+    """
+    Classification of the registered plugin types, built once from the plugin pool.
+
+    An entry is rebuilt as soon as the plugin class registered for its
+    plugin type changes, e.g. when tests register plugins.
+    """
+
+    def __init__(self):
+        self._roles = {}
+
+    def build(self):
+        # import here due because of circular imports
+        from .cms_plugins import Field, FieldContainer, FormElement, FormPlugin, SubmitButton
+
+        plugin_pool.discover_plugins()
+        roles = {}
+
+        for plugin_type, plugin_class in plugin_pool.plugins.items():
+            roles[plugin_type] = PluginRole(
+                plugin_class=plugin_class,
+                model=plugin_class.model,
+                is_form_element=issubclass(plugin_class, FormElement),
+                is_form=issubclass(plugin_class, FormPlugin),
+                is_field=issubclass(plugin_class, Field),
+                is_container=issubclass(plugin_class, FieldContainer),
+                is_submit_button=issubclass(plugin_class, SubmitButton),
+                is_alias=issubclass(plugin_class, AliasPlugin),
+            )
+        return roles
+
+    def get(self, plugin_type):
+        """
+        Returns the PluginRole of the plugin type, None if the plugin type is not registered.
+        """
+        role = self._roles.get(plugin_type)
+
+        if role is not None and plugin_pool.plugins.get(plugin_type) is role.plugin_class:
+            return role
+
+        plugin_pool.discover_plugins()
+
+        if plugin_type not in plugin_pool.plugins:
+            return None
+
+        self.rebuild()
+        return self._roles.get(plugin_type)
+
+    def rebuild(self):
+        self._roles = self.build()
+
+    def clear(self):
+        self._roles = {}
+
+
+plugin_roles = PluginRoles()
+
+
+def get_plugin_role(plugin_type):
+    return plugin_roles.get(plugin_type)
 
 
 def get_user_name(user):
@@ -11,14 +91,13 @@ def get_user_name(user):
 
 
 def is_form_element(plugin):
-    # import here due because of circular imports
-    from .cms_plugins import FormElement
-
+    role = get_plugin_role(plugin.plugin_type)
     # cms_plugins.CMSPlugin subclass
-    cms_plugin = plugin.get_plugin_class_instance(None)
-    is_orphan_plugin = cms_plugin.model != plugin.__class__
-    plugin_class = plugin.get_plugin_class()
-    if plugin.get_plugin_class() == AliasPlugin:
-        plugin_class = plugin.plugin.get_plugin_class()
-    is_element_subclass = issubclass(plugin_class, FormElement)
-    return (not is_orphan_plugin) and is_element_subclass
+    is_orphan_plugin = role is None or role.model != plugin.__class__
+
+    if is_orphan_plugin:
+        return False
+    if role.is_alias:
+        role = get_plugin_role(plugin.plugin.plugin_type) if plugin.plugin_id else None
+        return role is not None and role.is_form_element
+    return role.is_form_element
@@ -0,0 +1,244 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.db import transaction
+
+from .constants import (
+    ALDRYN_FORMS_DEFERRED_SENDING_RETRY_DELAY, DEFAULT_ALDRYN_FORMS_DEFERRED_SENDING,
+    DEFAULT_ALDRYN_FORMS_DEFERRED_SENDING_RETRIES, DEFAULT_ALDRYN_FORMS_DEFERRED_SENDING_WORKERS,
+    DEFAULT_ALDRYN_FORMS_EMAIL_OUTBOX, DEFAULT_ALDRYN_FORMS_SMTP_POOL_IDLE_TIMEOUT, DEFAULT_ALDRYN_FORMS_SMTP_POOL_SIZE,
+)
+from .models import OutboxEmail
+
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+# The messages collected by collect_messages(), None outside of it.
+_collected_messages = ContextVar('aldryn_forms_collected_messages', default=None)
+
+
+def is_deferred_sending_enabled():
+    return getattr(settings, 'ALDRYN_FORMS_DEFERRED_SENDING', DEFAULT_ALDRYN_FORMS_DEFERRED_SENDING)
+
+
+def get_sending_executor():
+    """
+    Returns the thread pool sending the emails of submissions, created on first use.
+
+    Its size bounds the number of SMTP connections open at the same time.
+    """
+    global _executor
+
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(
+                    settings, 'ALDRYN_FORMS_DEFERRED_SENDING_WORKERS', DEFAULT_ALDRYN_FORMS_DEFERRED_SENDING_WORKERS),
+                thread_name_prefix='aldryn_forms_mail',
+            )
+    return _executor
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of open email backend connections, see ALDRYN_FORMS_SMTP_POOL_SIZE.
+
+    Connections are reused across submissions, so that they don't pay for
+    connecting to the mail server every time. A connection idle for longer than
+    ALDRYN_FORMS_SMTP_POOL_IDLE_TIMEOUT, or not answering a NOOP, is closed.
+    """
+
+    def __init__(self):
+        self._idle = []
+        self._lock = threading.Lock()
+
+    @property
+    def size(self):
+        return getattr(settings, 'ALDRYN_FORMS_SMTP_POOL_SIZE', DEFAULT_ALDRYN_FORMS_SMTP_POOL_SIZE)
+
+    @property
+    def idle_timeout(self):
+        return getattr(settings, 'ALDRYN_FORMS_SMTP_POOL_IDLE_TIMEOUT', DEFAULT_ALDRYN_FORMS_SMTP_POOL_IDLE_TIMEOUT)
+
+    @contextmanager
+    def connection(self):
+        """
+        Yields an open connection, returned to the pool unless sending through it failed.
+        """
+        if self.size <= 0:
+            yield get_connection(fail_silently=False)
+            return
+
+        connection = self.acquire()
+
+        try:
+            yield connection
+        except Exception:
+            close_connection(connection)
+            raise
+        self.release(connection)
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                connection, released_at = self._idle.pop()
+
+            if time.monotonic() - released_at < self.idle_timeout and is_connection_usable(connection):
+                return connection
+            close_connection(connection)
+
+        connection = get_connection(fail_silently=False)
+        connection.open()
+        return connection
+
+    def release(self, connection):
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append((connection, time.monotonic()))
+                return
+        close_connection(connection)
+
+    def clear(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+
+        for connection, _ in idle:
+            close_connection(connection)
+
+    def __len__(self):
+        return len(self._idle)
+
+
+connection_pool = ConnectionPool()
+
+
+def is_connection_usable(connection):
+    # Only the SMTP backend keeps a connection to a server.
+    if not hasattr(connection, 'connection'):
+        return True
+    if connection.connection is None:
+        return False
+    try:
+        return connection.connection.noop()[0] == 250
+    except Exception:
+        return False
+
+
+def close_connection(connection):
+    try:
+        connection.close()
+    except Exception:
+        # The connection is dropped anyway, different email backends raise different exceptions.
+        pass
+
+
+def is_email_outbox_enabled():
+    return getattr(settings, 'ALDRYN_FORMS_EMAIL_OUTBOX', DEFAULT_ALDRYN_FORMS_EMAIL_OUTBOX)
+
+
+def send_messages(messages, form_name=''):
+    """
+    Sends the given email messages of a submission of the named form over one connection.
+
+    Within collect_messages() the messages are collected and sent together
+    with the other emails of the submission.
+    With ALDRYN_FORMS_EMAIL_OUTBOX the messages are stored in the outbox, within
+    the current transaction, and sent by the send_aldryn_forms_emails command.
+    With ALDRYN_FORMS_DEFERRED_SENDING they are sent by the thread pool once the
+    current transaction commits. The request doesn't wait for the mail server
+    in both cases, errors are retried and logged, not raised.
+    Like EmailMessage.send(), messages without recipients are not sent.
+    """
+    messages = [message for message in messages if message.recipients()]
+
+    if not messages:
+        return
+
+    collected_messages = _collected_messages.get()
+
+    if collected_messages is not None:
+        collected_messages.extend(messages)
+        return
+
+    if is_email_outbox_enabled():
+        OutboxEmail.objects.bulk_create([OutboxEmail.from_message(message, form_name) for message in messages])
+        return
+
+    if not is_deferred_sending_enabled():
+        with connection_pool.connection() as connection:
+            connection.send_messages(messages)
+        return
+
+    transaction.on_commit(lambda: get_sending_executor().submit(send_messages_with_retries, messages, form_name))
+
+
+@contextmanager
+def collect_messages(form_name=''):
+    """
+    Collects the messages passed to send_messages() within and sends them
+    together, e.g. all emails of a submission of the named form.
+
+    The messages are sent over one connection once the current transaction
+    commits, nothing is sent when the block raises. Sending errors are logged
+    together instead of being raised.
+    """
+    messages = []
+    token = _collected_messages.set(messages)
+
+    try:
+        yield messages
+    finally:
+        _collected_messages.reset(token)
+
+    if not messages:
+        return
+
+    if is_email_outbox_enabled() or is_deferred_sending_enabled():
+        send_messages(messages, form_name)
+    else:
+        transaction.on_commit(lambda: send_collected_messages(messages, form_name))
+
+
+def send_collected_messages(messages, form_name=''):
+    try:
+        with connection_pool.connection() as connection:
+            connection.send_messages(messages)
+    except Exception as err:
+        # Catch all exceptions, different email backends raise different ones.
+        logger.exception(f'Could not send {describe_messages(messages, form_name)}. {err}')
+
+
+def send_messages_with_retries(messages, form_name=''):
+    retries = getattr(settings, 'ALDRYN_FORMS_DEFERRED_SENDING_RETRIES', DEFAULT_ALDRYN_FORMS_DEFERRED_SENDING_RETRIES)
+
+    for attempt in range(retries + 1):
+        try:
+            with connection_pool.connection() as connection:
+                connection.send_messages(messages)
+        except Exception as err:
+            # Catch all exceptions, different email backends raise different ones.
+            if attempt == retries:
+                logger.exception(f'Could not send {describe_messages(messages, form_name)}, giving up. {err}')
+                return
+            delay = ALDRYN_FORMS_DEFERRED_SENDING_RETRY_DELAY * 2 ** attempt
+            logger.warning(f'Could not send {len(messages)} emails, retrying in {delay} seconds. {err}')
+            time.sleep(delay)
+        else:
+            return
+
+
+def describe_messages(messages, form_name=''):
+    description = ', '.join(f'"{message.subject}" to {", ".join(message.recipients())}' for message in messages)
+    if form_name:
+        return f'{len(messages)} emails of form "{form_name}": {description}'
+    return f'{len(messages)} emails: {description}'
@@ -0,0 +1,127 @@
+import time
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from aldryn_forms.constants import ALDRYN_FORMS_EMAIL_OUTBOX_CLAIM_TIMEOUT, ALDRYN_FORMS_EMAIL_OUTBOX_RETRY_DELAY
+from aldryn_forms.models import OutboxEmail
+
+
+class Command(BaseCommand):
+    help = 'Sends the emails of form submissions waiting in the outbox.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=100,
+            help='Number of emails taken from the outbox at once (default: 100).',
+        )
+        parser.add_argument(
+            '--max-attempts', type=int, default=5,
+            help='Number of attempts after which an email is marked as failed (default: 5).',
+        )
+        parser.add_argument(
+            '--retry-failed', action='store_true',
+            help='Queue failed emails again before sending.',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        max_attempts = options['max_attempts']
+
+        if batch_size < 1:
+            raise CommandError('The batch size must be at least 1.')
+        if max_attempts < 1:
+            raise CommandError('The number of attempts must be at least 1.')
+
+        if options['retry_failed']:
+            requeued = OutboxEmail.objects.filter(status=OutboxEmail.STATUS_FAILED).update(
+                status=OutboxEmail.STATUS_PENDING,
+                attempts=0,
+                next_attempt_at=timezone.now(),
+            )
+            self.stdout.write(f'Queued {requeued} failed emails again.')
+
+        mail_connection = get_connection(fail_silently=False)
+
+        try:
+            mail_connection.open()
+        except Exception as error:
+            raise CommandError(f'Could not connect to the mail server: {error}')
+
+        stats = defaultdict(Counter)
+        start = time.perf_counter()
+
+        try:
+            while self.send_batch(mail_connection, batch_size, max_attempts, stats):
+                pass
+        finally:
+            mail_connection.close()
+
+        duration = time.perf_counter() - start
+
+        for form_name, counts in sorted(stats.items()):
+            # The time spent sending the emails of this form only.
+            rate = counts['sent'] / counts['seconds'] if counts['seconds'] else 0
+            self.stdout.write(
+                f'"{form_name}": {counts["sent"]} sent, {counts["retried"]} to retry, {counts["failed"]} failed, '
+                f'{rate:.1f} emails/s'
+            )
+        total = sum(counts['sent'] for counts in stats.values())
+        self.stdout.write(f'Sent {total} emails in {duration:.3f}s.')
+
+    def send_batch(self, mail_connection, batch_size, max_attempts, stats):
+        """
+        Sends the next batch of due emails, returns how many emails were in it.
+
+        The batch is claimed in a short transaction by moving the next attempt
+        of its emails into the future, so that commands running at the same time
+        skip them. Each email is saved as soon as it was sent, an email claimed
+        by a command which died is sent again once the claim expires.
+        """
+        with transaction.atomic():
+            emails = list(
+                OutboxEmail.objects
+                .select_for_update(skip_locked=connection.features.has_select_for_update_skip_locked)
+                .filter(status=OutboxEmail.STATUS_PENDING, next_attempt_at__lte=timezone.now())
+                [:batch_size]
+            )
+            claimed_until = timezone.now() + timedelta(seconds=ALDRYN_FORMS_EMAIL_OUTBOX_CLAIM_TIMEOUT)
+            OutboxEmail.objects.filter(pk__in=[email.pk for email in emails]).update(next_attempt_at=claimed_until)
+
+        for email in emails:
+            self.send_email(mail_connection, email, max_attempts, stats[email.form_name])
+        return len(emails)
+
+    def send_email(self, mail_connection, email, max_attempts, counts):
+        email.attempts += 1
+        start = time.perf_counter()
+
+        try:
+            # Reconnects when a previous error closed the connection.
+            mail_connection.open()
+            mail_connection.send_messages([email.get_message(mail_connection)])
+        except Exception as error:
+            # Catch all exceptions, different email backends raise different ones.
+            mail_connection.close()
+            email.last_error = str(error)
+
+            if email.attempts >= max_attempts:
+                email.status = OutboxEmail.STATUS_FAILED
+                counts['failed'] += 1
+                self.stderr.write(f'Giving up on email {email.pk} "{email.subject}": {error}')
+            else:
+                delay = ALDRYN_FORMS_EMAIL_OUTBOX_RETRY_DELAY * 2 ** (email.attempts - 1)
+                email.next_attempt_at = timezone.now() + timedelta(seconds=delay)
+                counts['retried'] += 1
+        else:
+            email.status = OutboxEmail.STATUS_SENT
+            email.sent_at = timezone.now()
+            email.last_error = ''
+            counts['sent'] += 1
+        finally:
+            counts['seconds'] += time.perf_counter() - start
+        email.save(update_fields=['status', 'attempts', 'next_attempt_at', 'last_error', 'sent_at'])
@@ -0,0 +1,88 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from cms.plugin_pool import plugin_pool
+
+from aldryn_forms.cache import store_form_manifest
+from aldryn_forms.models import FormPlugin
+from aldryn_forms.utils import get_plugin_tree, get_public_form_plugins
+
+
+class Command(BaseCommand):
+    help = 'Builds the manifests and form classes of all forms on public pages and stores them in the cache.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=4,
+            help='Number of forms built in parallel (default: 4).',
+        )
+        parser.add_argument(
+            '--max-seconds', type=float, default=None,
+            help='Fail when building any form takes longer than this.',
+        )
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        max_seconds = options['max_seconds']
+
+        if workers < 1:
+            raise CommandError('The number of workers must be at least 1.')
+
+        form_plugin_ids = [
+            plugin.pk for plugin in get_public_form_plugins().only('pk', 'plugin_type')
+            if plugin.plugin_type in plugin_pool.plugins
+        ]
+
+        if workers == 1:
+            results = [self.warm_form(form_plugin_id) for form_plugin_id in form_plugin_ids]
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(self.warm_form_in_thread, form_plugin_ids))
+
+        failed = []
+        slow = []
+
+        for form_plugin_id, description, duration, error in results:
+            if error is not None:
+                failed.append(form_plugin_id)
+                self.stderr.write(f'{description}: {error}')
+                continue
+
+            message = f'{description}: {duration:.3f}s'
+
+            if max_seconds is not None and duration > max_seconds:
+                slow.append(form_plugin_id)
+                self.stderr.write(self.style.WARNING(message))
+            else:
+                self.stdout.write(message)
+
+        total = sum(duration for _, _, duration, _ in results)
+        self.stdout.write(f'Warmed up {len(results) - len(failed)} of {len(results)} forms in {total:.3f}s.')
+
+        if failed:
+            raise CommandError(f'Building {len(failed)} forms failed: {failed}')
+        if slow:
+            raise CommandError(f'Building {len(slow)} forms took longer than {max_seconds}s: {slow}')
+
+    def warm_form_in_thread(self, form_plugin_id):
+        try:
+            return self.warm_form(form_plugin_id)
+        finally:
+            # Every thread opens its own database connections.
+            connections.close_all()
+
+    def warm_form(self, form_plugin_id):
+        description = f'Form {form_plugin_id}'
+        start = time.perf_counter()
+
+        try:
+            form_plugin = get_plugin_tree(FormPlugin, pk=form_plugin_id)
+            description = f'{form_plugin.plugin_type} {form_plugin_id} "{form_plugin.name}" ({form_plugin.language})'
+            store_form_manifest(form_plugin)
+            form_plugin.get_plugin_class_instance().get_form_class(form_plugin)
+        except Exception as error:
+            return form_plugin_id, description, time.perf_counter() - start, error
+        return form_plugin_id, description, time.perf_counter() - start, None
@@ -0,0 +1,50 @@
+from typing import Optional
+
+from django.http import HttpRequest, HttpResponse
+from django.middleware.csrf import get_token
+from django.utils.deprecation import MiddlewareMixin
+
+from cms.utils.helpers import get_header_name
+
+from aldryn_forms.constants import ALDRYN_FORMS_CSRF_TOKEN_MARKER, ALDRYN_FORMS_SUBMISSION_HEADER
+from aldryn_forms.utils import is_success_redirect
+
+
+def contains_cacheable_form(response: HttpResponse) -> bool:
+    """Check whether the response contains forms rendered for the CMS caches."""
+    if response.streaming or not response.get('Content-Type', '').startswith('text/html'):
+        return False
+    return ALDRYN_FORMS_CSRF_TOKEN_MARKER.encode() in response.content
+
+
+def limit_page_cache_ttl(response: HttpResponse) -> Optional[int]:
+    """
+    Keep pages with forms out of the CMS page cache.
+
+    The page cache is read regardless of the request method, so form submissions would get the cached page.
+    Use as settings.CMS_LIMIT_TTL_CACHE_FUNCTION.
+    """
+    return 0 if contains_cacheable_form(response) else None
+
+
+class CacheableForms(MiddlewareMixin):
+    """Fill in the per-request parts of forms served from the CMS caches."""
+
+    def process_request(self, request: HttpRequest) -> None:
+        """Make cached form HTML vary between submissions and other requests."""
+        header_name = get_header_name(ALDRYN_FORMS_SUBMISSION_HEADER)
+        if request.method == 'POST' or is_success_redirect(request):
+            request.META[header_name] = 'true'
+        else:
+            request.META.pop(header_name, None)
+
+    def process_response(self, request: HttpRequest, response: HttpResponse) -> HttpResponse:
+        """Replace the CSRF token marker by the token of the request."""
+        if not contains_cacheable_form(response):
+            return response
+
+        marker = ALDRYN_FORMS_CSRF_TOKEN_MARKER.encode()
+        response.content = response.content.replace(marker, get_token(request).encode())
+        if response.has_header('Content-Length'):
+            response['Content-Length'] = str(len(response.content))
+        return response
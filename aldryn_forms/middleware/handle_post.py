@@ -1,21 +1,41 @@
+import re
 from typing import Callable, Dict, Optional, Tuple
 
-from django.http import HttpRequest, HttpResponse, HttpResponseRedirect
+from django.conf import settings
+from django.http import HttpRequest, HttpResponse
 from django.utils.deprecation import MiddlewareMixin
 
+from aldryn_forms.constants import (
+    ALDRYN_FORMS_POST_CONTENT_TYPES, DEFAULT_ALDRYN_FORMS_HANDLE_POST_EXCLUDED_PATHS,
+    DEFAULT_ALDRYN_FORMS_HANDLE_POST_PATHS,
+)
 from aldryn_forms.models import FormPlugin
-from aldryn_forms.utils import get_plugin_tree
+from aldryn_forms.registry import can_submit_form
+from aldryn_forms.utils import HttpResponseSeeOther, get_plugin_tree, get_success_redirect_url
 
 
 class HandleHttpPost(MiddlewareMixin):
     """Handle HTTP POST."""
 
+    def is_form_submission(self, request: HttpRequest) -> bool:
+        """Check without parsing the request body whether the request can submit a form."""
+        if request.method != 'POST' or request.content_type not in ALDRYN_FORMS_POST_CONTENT_TYPES:
+            return False
+
+        paths = getattr(settings, 'ALDRYN_FORMS_HANDLE_POST_PATHS', DEFAULT_ALDRYN_FORMS_HANDLE_POST_PATHS)
+        if paths is not None and not any(re.match(pattern, request.path_info) for pattern in paths):
+            return False
+
+        excluded_paths = getattr(
+            settings, 'ALDRYN_FORMS_HANDLE_POST_EXCLUDED_PATHS', DEFAULT_ALDRYN_FORMS_HANDLE_POST_EXCLUDED_PATHS)
+        return not any(re.match(pattern, request.path_info) for pattern in excluded_paths)
+
     def process_view(
         self, request: HttpRequest, callback: Callable, callback_args: Tuple[str, ...], callback_kwargs: Dict[str, str]
     ) -> Optional[HttpResponse]:
         """Process view when request method is POST and when the form plugin is found."""
 
-        if request.method != 'POST':
+        if not self.is_form_submission(request):
             return None
 
         # The following code is written according to the function submit_form_view in views.py.
@@ -24,6 +44,8 @@ class HandleHttpPost(MiddlewareMixin):
             return None
         if not form_plugin_id.isdigit():
             return None
+        if not can_submit_form(request, form_plugin_id):
+            return None
 
         try:
             form_plugin = get_plugin_tree(FormPlugin, pk=form_plugin_id)
@@ -34,7 +56,15 @@ class HandleHttpPost(MiddlewareMixin):
         form = form_plugin_instance.process_form(form_plugin, request)
         success_url = form_plugin_instance.get_success_url(instance=form_plugin)
 
-        if form.is_valid() and success_url:
-            return HttpResponseRedirect(success_url)
+        if form.is_valid():
+            return HttpResponseSeeOther(get_success_redirect_url(request, form_plugin, success_url))
 
         return None
+
+    def process_response(self, request: HttpRequest, response: HttpResponse) -> HttpResponse:
+        """Redirect after a form which was submitted while rendering the page."""
+        success_redirect_url = getattr(request, '_aldryn_forms_success_redirect_url', None)
+
+        if success_redirect_url is not None and response.status_code == 200:
+            return HttpResponseSeeOther(success_redirect_url)
+        return response
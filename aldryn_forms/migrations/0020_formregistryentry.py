@@ -0,0 +1,29 @@
+# Generated by Django 4.2.30 on 2026-10-18 03:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cms', '0003_auto_20140926_2347'),
+        ('aldryn_forms', '0019_auto_20241127_1746'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FormRegistryEntry',
+            fields=[
+                ('form_plugin', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to='cms.cmsplugin')),
+                ('placeholder_id', models.PositiveIntegerField()),
+                ('page_id', models.PositiveIntegerField(blank=True, db_index=True, null=True)),
+                ('language', models.CharField(max_length=15)),
+                ('is_published', models.BooleanField(default=False)),
+            ],
+            options={
+                'verbose_name': 'Form registry entry',
+                'verbose_name_plural': 'Form registry entries',
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 4.2.30 on 2026-10-18 03:41
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aldryn_forms', '0020_formregistryentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxEmail',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('form_name', models.CharField(blank=True, max_length=255, verbose_name='form name')),
+                ('from_email', models.CharField(max_length=255, verbose_name='from')),
+                ('to', models.JSONField(default=list, verbose_name='to')),
+                ('cc', models.JSONField(default=list, verbose_name='cc')),
+                ('bcc', models.JSONField(default=list, verbose_name='bcc')),
+                ('reply_to', models.JSONField(default=list, verbose_name='reply to')),
+                ('headers', models.JSONField(default=dict, verbose_name='headers')),
+                ('subject', models.TextField(blank=True, verbose_name='subject')),
+                ('body', models.TextField(blank=True, verbose_name='body')),
+                ('html_body', models.TextField(blank=True, verbose_name='HTML body')),
+                ('status', models.CharField(choices=[('pending', 'pending'), ('sent', 'sent'), ('failed', 'failed')], default='pending', max_length=10, verbose_name='status')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='attempts')),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='next attempt at')),
+                ('last_error', models.TextField(blank=True, verbose_name='last error')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='created at')),
+                ('sent_at', models.DateTimeField(blank=True, null=True, verbose_name='sent at')),
+            ],
+            options={
+                'verbose_name': 'Outbox email',
+                'verbose_name_plural': 'Outbox emails',
+                'ordering': ['next_attempt_at', 'pk'],
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='aldryn_form_status_c30ee8_idx')],
+            },
+        ),
+    ]
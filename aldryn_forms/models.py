@@ -1,29 +1,31 @@
+import copy
 import json
 import re
 import warnings
 from collections import defaultdict, namedtuple
 from functools import partial
-from typing import List
+from typing import List, Optional
 
 from django.conf import settings
 from django.core.exceptions import ValidationError
+from django.core.mail import EmailMultiAlternatives
 from django.db import models
 from django.db.models.functions import Coalesce
+from django.utils import timezone
 from django.utils.functional import cached_property
 from django.utils.translation import gettext_lazy as _
 
-from cms.cms_plugins import AliasPlugin
 from cms.models.fields import PageField
 from cms.models.pluginmodel import CMSPlugin
-from cms.utils.plugins import downcast_plugins
 
 from djangocms_attributes_field.fields import AttributesField
 from filer.fields.folder import FilerFolderField
 
-from .compat import build_plugin_tree
-from .helpers import is_form_element
+from .helpers import get_plugin_role, is_form_element
 from .sizefield.models import FileSizeField
-from .utils import ALDRYN_FORMS_ACTION_BACKEND_KEY_MAX_SIZE, action_backend_choices, get_action_backends
+from .utils import (
+    ALDRYN_FORMS_ACTION_BACKEND_KEY_MAX_SIZE, action_backend_choices, get_action_backends, get_parent_form_plugin,
+)
 
 
 AUTH_USER_MODEL = getattr(settings, 'AUTH_USER_MODEL', 'auth.User')
@@ -67,6 +69,39 @@ BaseSerializedFormField = namedtuple(
 )
 
 
+class FormFieldIndex:
+    """
+    Lookup of the fields of a form by their plugin id and by their name.
+    """
+
+    def __init__(self, fields: List[FormField]):
+        self.fields = tuple(fields)
+        self.by_plugin_id = {field.plugin_instance.pk: field for field in fields}
+        self.by_name = {field.name: field for field in fields}
+
+    def __len__(self):
+        return len(self.fields)
+
+    def get_name(self, plugin_id: int) -> str:
+        return self.by_plugin_id[plugin_id].name
+
+    def get_plugin_instance(self, name: str) -> 'FieldPluginBase':
+        return self.by_name[name].plugin_instance
+
+
+# The structure of a form: its elements, fields and submit button.
+# It is never modified once built, so it can be shared between threads.
+CompiledForm = namedtuple(
+    'CompiledForm',
+    field_names=[
+        'elements',
+        'fields',
+        'field_index',
+        'submit_button',
+    ]
+)
+
+
 class SerializedFormField(BaseSerializedFormField):
 
     # For _asdict() with Py3K
@@ -109,8 +144,7 @@ class BaseFormPlugin(CMSPlugin):
         (REDIRECT_TO_URL, _('Absolute URL')),
     ]
 
-    _form_elements = None
-    _form_field_key_cache = None
+    _compiled_form = None
 
     name = models.CharField(
         verbose_name=_('Name'),
@@ -229,21 +263,42 @@ class BaseFormPlugin(CMSPlugin):
         for recipient in oldinstance.recipients.all():
             self.recipients.add(recipient)
 
-    def get_submit_button(self):
-        from .cms_plugins import SubmitButton
+    def get_compiled_form(self) -> CompiledForm:
+        """
+        Returns the compiled form, built once per instance.
+
+        Building it doesn't modify the plugin instance or its plugin tree.
+        """
+        compiled_form = self._compiled_form
+
+        if compiled_form is None:
+            compiled_form = self._compiled_form = self.compile_form()
+        return compiled_form
 
-        form_elements = self.get_form_elements()
+    def compile_form(self, form_elements: Optional[List[CMSPlugin]] = None) -> CompiledForm:
+        if form_elements is None:
+            form_elements = self._load_form_elements()
 
-        for element in form_elements:
-            plugin_class = element.get_plugin_class()
+        form_elements = tuple(form_elements)
+        fields = self._get_form_fields(form_elements)
+        submit_buttons = (
+            element for element in form_elements
+            if get_plugin_role(element.plugin_type).is_submit_button
+        )
+        return CompiledForm(
+            elements=form_elements,
+            fields=tuple(fields),
+            field_index=FormFieldIndex(fields),
+            submit_button=next(submit_buttons, None),
+        )
 
-            if issubclass(plugin_class, SubmitButton):
-                return element
-        return
+    def get_submit_button(self):
+        return self.get_compiled_form().submit_button
 
     def get_form_fields(self) -> List[FormField]:
-        from .cms_plugins import Field
+        return list(self.get_compiled_form().fields)
 
+    def _get_form_fields(self, form_elements) -> List[FormField]:
         fields = []
 
         # A field occurrence is how many times does a field
@@ -256,18 +311,21 @@ class BaseFormPlugin(CMSPlugin):
         # This is used as an identifier for the field within this form.
         field_type_occurrences = defaultdict(lambda: 1)
 
-        form_elements = self.get_form_elements()
         field_plugins = []
         for plugin in form_elements:
-            if issubclass(plugin.get_plugin_class(), Field):
+            role = get_plugin_role(plugin.plugin_type)
+
+            if role.is_field:
                 field_plugins.append(plugin)
-            elif issubclass(plugin.get_plugin_class(), AliasPlugin):
+            elif role.is_alias:
                 if hasattr(plugin, "plugin"):
                     plugin = plugin.plugin
-                if issubclass(plugin.get_plugin_class(), Field):
+                if get_plugin_role(plugin.plugin_type).is_field:
+                    # Alias targets are already downcasted by downcast_form_plugins,
+                    # get_plugin_instance() then doesn't query the database.
                     field_plugins.append(plugin.get_plugin_instance()[0])
 
-        unique_field_names = []
+        unique_field_names = set()
         for field_plugin in field_plugins:
             field_type = field_plugin.field_type
 
@@ -293,7 +351,7 @@ class BaseFormPlugin(CMSPlugin):
             # Make filed names unique.
             while field_name in unique_field_names:
                 field_name += "_"
-            unique_field_names.append(field_name)
+            unique_field_names.add(field_name)
 
             field = FormField(
                 name=field_name,
@@ -305,17 +363,11 @@ class BaseFormPlugin(CMSPlugin):
             fields.append(field)
         return fields
 
-    def get_form_field_name(self, field: 'FieldPluginBase') -> str:
-        if self._form_field_key_cache is None:
-            self._form_field_key_cache = {}
-
-        is_cache_needs_update = field.pk not in self._form_field_key_cache
-        if is_cache_needs_update:
-            form_fields: List[FormField] = self.get_form_fields()
-            for form_field in form_fields:
-                self._form_field_key_cache[form_field.plugin_instance.pk] = form_field.name
+    def get_form_field_index(self) -> 'FormFieldIndex':
+        return self.get_compiled_form().field_index
 
-        return self._form_field_key_cache[field.pk]
+    def get_form_field_name(self, field: 'FieldPluginBase') -> str:
+        return self.get_form_field_index().get_name(field.pk)
 
     def get_form_fields_as_choices(self):
         fields = self.get_form_fields()
@@ -324,30 +376,20 @@ class BaseFormPlugin(CMSPlugin):
             yield (field.name, field.label)
 
     def get_form_elements(self):
-        from .utils import get_nested_plugins
+        return list(self.get_compiled_form().elements)
+
+    def _load_form_elements(self):
+        from .utils import attach_child_plugins, downcast_form_plugins, get_nested_plugins, get_plugin_descendants
+
+        plugin = self
 
         if self.child_plugin_instances is None:
-            descendants = get_nested_plugins(self)
-            # Set parent_id to None in order to
-            # fool the build_plugin_tree function.
-            # This is sadly necessary to avoid getting all nodes
-            # higher than the form.
-            parent_id = self.parent_id
-            self.parent_id = None
-            # Important that this is a list in order to modify
-            # the current instance
-            descendants_with_self = [self] + list(descendants)
-            # Let the cms build the tree
-            build_plugin_tree(descendants_with_self)
-            # Set back the original parent
-            self.parent_id = parent_id
-
-        if self._form_elements is None:
-            children = get_nested_plugins(self)
-            children_instances = downcast_plugins(children)
-            self._form_elements = [
-                p for p in children_instances if is_form_element(p)]
-        return self._form_elements
+            # Build the plugin tree on a copy, this instance may be shared.
+            plugin = copy.copy(self)
+            attach_child_plugins(plugin, downcast_form_plugins(get_plugin_descendants(self)))
+
+        children_instances = downcast_form_plugins(get_nested_plugins(plugin))
+        return [p for p in children_instances if is_form_element(p)]
 
 
 class FormPlugin(BaseFormPlugin):
@@ -497,17 +539,12 @@ class EmailFieldPlugin(FieldPluginBase):
     )
 
     def get_parent_form(self):
-        parent = self.parent
-        while parent is not None:
-            if parent.plugin_type in ("FormPlugin", "EmailNotificationForm"):
-                break
-            parent = self.parent
-        return parent
+        return get_parent_form_plugin(self)
 
     def get_parent_form_action_backend(self):
-        parent = self.parent
+        parent = self.get_parent_form()
         if parent is not None:
-            return parent, get_action_backends().get(parent.get_plugin_instance()[0].action_backend)
+            return parent, get_action_backends().get(parent.action_backend)
         return None, None
 
 
@@ -766,3 +803,112 @@ class FormSubmission(FormSubmissionBase):
         ordering = ['-sent_at']
         verbose_name = _('Form submission')
         verbose_name_plural = _('Form submissions')
+
+
+class FormRegistryEntry(models.Model):
+    """
+    Where a form plugin is placed, kept up to date by signals.
+
+    Submissions are checked against it before the form is built.
+    """
+    form_plugin = models.OneToOneField(
+        to=CMSPlugin,
+        primary_key=True,
+        related_name='+',
+        on_delete=models.CASCADE,
+    )
+    placeholder_id = models.PositiveIntegerField()
+    page_id = models.PositiveIntegerField(null=True, blank=True, db_index=True)
+    language = models.CharField(max_length=15)
+    is_published = models.BooleanField(default=False)
+
+    class Meta:
+        verbose_name = _('Form registry entry')
+        verbose_name_plural = _('Form registry entries')
+
+    def __str__(self):
+        return str(self.form_plugin_id)
+
+
+class OutboxEmail(models.Model):
+    """
+    An email of a form submission waiting in the outbox, see ALDRYN_FORMS_EMAIL_OUTBOX.
+
+    Emails are stored as rendered at submission time and sent by the
+    send_aldryn_forms_emails command.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, _('pending')),
+        (STATUS_SENT, _('sent')),
+        (STATUS_FAILED, _('failed')),
+    ]
+
+    form_name = models.CharField(verbose_name=_('form name'), max_length=255, blank=True)
+    from_email = models.CharField(verbose_name=_('from'), max_length=255)
+    to = models.JSONField(verbose_name=_('to'), default=list)
+    cc = models.JSONField(verbose_name=_('cc'), default=list)
+    bcc = models.JSONField(verbose_name=_('bcc'), default=list)
+    reply_to = models.JSONField(verbose_name=_('reply to'), default=list)
+    headers = models.JSONField(verbose_name=_('headers'), default=dict)
+    subject = models.TextField(verbose_name=_('subject'), blank=True)
+    body = models.TextField(verbose_name=_('body'), blank=True)
+    html_body = models.TextField(verbose_name=_('HTML body'), blank=True)
+    status = models.CharField(
+        verbose_name=_('status'),
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=STATUS_PENDING,
+    )
+    attempts = models.PositiveIntegerField(verbose_name=_('attempts'), default=0)
+    next_attempt_at = models.DateTimeField(verbose_name=_('next attempt at'), default=timezone.now)
+    last_error = models.TextField(verbose_name=_('last error'), blank=True)
+    created_at = models.DateTimeField(verbose_name=_('created at'), auto_now_add=True)
+    sent_at = models.DateTimeField(verbose_name=_('sent at'), null=True, blank=True)
+
+    class Meta:
+        ordering = ['next_attempt_at', 'pk']
+        indexes = [models.Index(fields=['status', 'next_attempt_at'])]
+        verbose_name = _('Outbox email')
+        verbose_name_plural = _('Outbox emails')
+
+    def __str__(self):
+        return self.subject
+
+    @classmethod
+    def from_message(cls, message, form_name=''):
+        html_bodies = [
+            content for content, mimetype in getattr(message, 'alternatives', [])
+            if mimetype == 'text/html'
+        ]
+        return cls(
+            form_name=form_name,
+            from_email=message.from_email,
+            to=list(message.to),
+            cc=list(message.cc),
+            bcc=list(message.bcc),
+            reply_to=list(message.reply_to),
+            headers=dict(message.extra_headers),
+            subject=message.subject,
+            body=message.body,
+            html_body=html_bodies[0] if html_bodies else '',
+        )
+
+    def get_message(self, connection=None):
+        message = EmailMultiAlternatives(
+            subject=self.subject,
+            body=self.body,
+            from_email=self.from_email,
+            to=self.to,
+            cc=self.cc,
+            bcc=self.bcc,
+            reply_to=self.reply_to,
+            headers=self.headers,
+            connection=connection,
+        )
+
+        if self.html_body:
+            message.attach_alternative(self.html_body, 'text/html')
+        return message
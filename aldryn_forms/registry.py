@@ -0,0 +1,97 @@
+from cms.models import CMSPlugin, Page
+
+from .compat import PageContent
+from .helpers import get_plugin_role
+from .models import FormRegistryEntry
+
+
+def is_form(plugin):
+    role = get_plugin_role(plugin.plugin_type)
+    return role is not None and role.is_form
+
+
+def get_placeholder_location(placeholder_id, language):
+    """
+    Returns the id of the page the placeholder belongs to, None for placeholders
+    outside of pages, and whether its content is published.
+    """
+    if PageContent is not None:
+        # django CMS 4 leaves publishing to djangocms-versioning.
+        page_id = (
+            PageContent._base_manager
+            .filter(placeholders__pk=placeholder_id)
+            .values_list('page_id', flat=True)
+            .first()
+        )
+        return page_id, True
+
+    page = Page.objects.filter(placeholders__pk=placeholder_id).first()
+
+    if page is None:
+        from cms.models import StaticPlaceholder
+
+        is_draft = StaticPlaceholder.objects.filter(draft_id=placeholder_id).exists()
+        return None, not is_draft
+    return page.pk, not page.publisher_is_draft and page.is_published(language)
+
+
+def register_form_plugin(plugin):
+    page_id, is_published = get_placeholder_location(plugin.placeholder_id, plugin.language)
+    entry, _ = FormRegistryEntry.objects.update_or_create(
+        form_plugin_id=plugin.pk,
+        defaults={
+            'placeholder_id': plugin.placeholder_id,
+            'page_id': page_id,
+            'language': plugin.language,
+            'is_published': is_published,
+        },
+    )
+    return entry
+
+
+def update_page_form_registry(page, language):
+    """
+    Updates the published state of the forms on the given page and its descendants.
+    """
+    pages = [page] + list(page.get_descendant_pages())
+
+    for page in pages:
+        is_published = not page.publisher_is_draft and page.is_published(language, force_reload=True)
+        FormRegistryEntry.objects.filter(page_id=page.pk, language=language).update(is_published=is_published)
+
+
+def get_form_registry_entry(form_plugin_id):
+    """
+    Returns the registry entry of the form plugin, None if there's no such form plugin.
+
+    Form plugins saved before the registry existed are registered on first use.
+    """
+    try:
+        return FormRegistryEntry.objects.get(form_plugin_id=form_plugin_id)
+    except FormRegistryEntry.DoesNotExist:
+        pass
+
+    plugin = CMSPlugin.objects.filter(pk=form_plugin_id).first()
+
+    if plugin is None or not is_form(plugin):
+        return None
+    return register_form_plugin(plugin)
+
+
+def can_submit_form(request, form_plugin_id):
+    """
+    Tells whether the request may submit the form plugin with the given id.
+
+    Forms which aren't published can only be submitted by staff,
+    who see them when editing pages.
+    """
+    entry = get_form_registry_entry(form_plugin_id)
+
+    if entry is None:
+        return False
+
+    if entry.is_published:
+        return True
+
+    user = getattr(request, 'user', None)
+    return user is not None and user.is_staff
@@ -0,0 +1,86 @@
+from django.conf import settings
+from django.utils.safestring import mark_safe
+
+from cms.templatetags.cms_tags import render_plugin as render_cms_plugin
+from cms.toolbar.utils import get_toolbar_from_request
+from cms.utils.conf import get_cms_setting
+
+from classytags.utils import flatten_context
+
+from .cache import template_cache
+from .constants import DEFAULT_ALDRYN_FORMS_SINGLE_PASS_RENDER
+from .helpers import get_plugin_role
+
+
+def is_single_pass_render_enabled():
+    return getattr(settings, 'ALDRYN_FORMS_SINGLE_PASS_RENDER', DEFAULT_ALDRYN_FORMS_SINGLE_PASS_RENDER)
+
+
+def can_render_in_single_pass(request):
+    """
+    Returns whether the forms of this request can be rendered by the FormRenderer.
+
+    Plugins in edit mode are wrapped in markup of the CMS and the processors
+    of the CMS run for every plugin, both need the plugin rendering of the CMS.
+    """
+    if not is_single_pass_render_enabled():
+        return False
+    if get_cms_setting('PLUGIN_PROCESSORS') or get_cms_setting('PLUGIN_CONTEXT_PROCESSORS'):
+        return False
+    return not get_toolbar_from_request(request).edit_mode_active
+
+
+def render_child_plugins(context, parent):
+    renderer = context.get('form_renderer')
+
+    if renderer is None:
+        content = [render_cms_plugin(context, plugin) for plugin in parent.child_plugin_instances or ()]
+    else:
+        content = [renderer.render_plugin(context, plugin) for plugin in parent.child_plugin_instances or ()]
+    return mark_safe('\n'.join(content))
+
+
+class FormRenderer:
+    """
+    Renders the elements of a form in a single pass.
+
+    Form elements are rendered in the template context of the form instead
+    of a context of their own built by the CMS, with templates from the
+    template cache. Any other plugin in the form is rendered by the CMS.
+    """
+
+    def __init__(self):
+        self.plugins = {}
+
+    def render_plugin(self, context, instance):
+        role = get_plugin_role(instance.plugin_type)
+
+        if role is None or not role.is_form_element or role.is_form:
+            return render_cms_plugin(context, instance)
+
+        plugin = self.plugins.get(instance.plugin_type)
+
+        if plugin is None:
+            plugin = self.plugins[instance.plugin_type] = instance.get_plugin_class_instance()
+        if not plugin.render_plugin:
+            return ''
+
+        placeholder = instance.placeholder
+
+        with context.push():
+            plugin_context = plugin.render(context, instance, placeholder.slot)
+
+            if plugin_context is not context:
+                for key, value in flatten_context(plugin_context).items():
+                    context[key] = value
+
+            template = self.get_template(plugin, context, instance, placeholder)
+            return mark_safe(template.render(context))
+
+    def get_template(self, plugin, context, instance, placeholder):
+        template = plugin._get_render_template(context, instance, placeholder)
+
+        if isinstance(template, str):
+            template = template_cache.select_template([template])
+        # The template of the engine renders the context as it is.
+        return getattr(template, 'template', template)
@@ -1,7 +1,18 @@
-from django.db.models.signals import pre_delete
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
 from django.dispatch import Signal, receiver
+from django.template.autoreload import get_template_directories
+from django.utils.autoreload import file_changed
 
-from .models import EmailFieldPlugin
+from cms.models import CMSPlugin
+
+from .cache import form_class_cache, invalidate_form_manifests, template_cache
+from .compat import post_publish, post_unpublish
+from .helpers import get_plugin_role
+from .mail import connection_pool
+from .models import EmailFieldPlugin, Option
+from .registry import is_form, register_form_plugin, update_page_form_registry
 
 
 form_pre_save = Signal()
@@ -13,3 +24,67 @@ def protect_form_action_backend(sender, instance, using, **kwargs):
     plugin_form, action_backend = instance.get_parent_form_action_backend()
     if action_backend is not None:
         getattr(action_backend, "delete_field", lambda field, form: None)(instance, plugin_form)
+
+
+@receiver(post_save, dispatch_uid='aldryn_forms_post_save_form_class_cache')
+@receiver(post_delete, dispatch_uid='aldryn_forms_post_delete_form_class_cache')
+def invalidate_form_class_cache(sender, instance, **kwargs):
+    if isinstance(instance, CMSPlugin):
+        form_class_cache.invalidate(instance.pk)
+    elif isinstance(instance, Option):
+        form_class_cache.invalidate(instance.field_id)
+
+
+@receiver(file_changed, dispatch_uid='aldryn_forms_template_changed')
+def clear_template_cache_on_template_change(sender, file_path, **kwargs):
+    # Runs next to the template autoreload of Django, which resets the template loaders.
+    if file_path.suffix != '.py' and any(directory in file_path.parents for directory in get_template_directories()):
+        template_cache.clear()
+
+
+@receiver(setting_changed, dispatch_uid='aldryn_forms_templates_changed')
+def clear_template_cache_on_setting_change(sender, setting, **kwargs):
+    if setting == 'TEMPLATES':
+        template_cache.clear()
+
+
+@receiver(setting_changed, dispatch_uid='aldryn_forms_email_settings_changed')
+def clear_connection_pool_on_setting_change(sender, setting, **kwargs):
+    if setting.startswith('EMAIL_'):
+        connection_pool.clear()
+
+
+def is_form_plugin(plugin):
+    role = get_plugin_role(plugin.plugin_type)
+    return role is not None and (role.is_form_element or role.is_alias)
+
+
+@receiver(post_save, dispatch_uid='aldryn_forms_post_save_form_manifest')
+@receiver(post_delete, dispatch_uid='aldryn_forms_post_delete_form_manifest')
+def invalidate_form_manifest(sender, instance, using=None, **kwargs):
+    if isinstance(instance, Option) or (isinstance(instance, CMSPlugin) and is_form_plugin(instance)):
+        # Other processes would otherwise rebuild the manifests from the data before the change.
+        transaction.on_commit(invalidate_form_manifests, using=using)
+
+
+def invalidate_form_manifest_on_publish(sender, instance, **kwargs):
+    transaction.on_commit(invalidate_form_manifests)
+
+
+@receiver(post_save, dispatch_uid='aldryn_forms_post_save_form_registry')
+def update_form_registry(sender, instance, raw=False, **kwargs):
+    if not raw and isinstance(instance, CMSPlugin) and is_form(instance):
+        register_form_plugin(instance)
+
+
+def update_form_registry_on_publish(sender, instance, language, **kwargs):
+    if instance.publisher_public is not None:
+        update_page_form_registry(instance.publisher_public, language)
+
+
+if post_publish is not None:
+    post_publish.connect(invalidate_form_manifest_on_publish, dispatch_uid='aldryn_forms_post_publish_form_manifest')
+    post_unpublish.connect(
+        invalidate_form_manifest_on_publish, dispatch_uid='aldryn_forms_post_unpublish_form_manifest')
+    post_publish.connect(update_form_registry_on_publish, dispatch_uid='aldryn_forms_post_publish_form_registry')
+    post_unpublish.connect(update_form_registry_on_publish, dispatch_uid='aldryn_forms_post_unpublish_form_registry')
@@ -4,6 +4,8 @@ from django.utils.safestring import mark_safe
 
 import markdown as markdown_module
 
+from aldryn_forms.rendering import render_child_plugins
+
 
 register = template.Library()
 
@@ -20,6 +22,11 @@ def render_notification_text(context, email_notification, email_type):
     return mark_safe(message)
 
 
+@register.simple_tag(takes_context=True)
+def render_form_elements(context, instance):
+    return render_child_plugins(context, instance)
+
+
 @register.simple_tag()
 def render_form_widget(field, **kwargs):
     if "class" in kwargs and field.errors:
@@ -1,15 +1,77 @@
+import copy
+from collections import defaultdict
+from functools import reduce
+from itertools import chain
+from operator import or_
+
 from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Q, prefetch_related_objects
 from django.forms.forms import NON_FIELD_ERRORS
+from django.http import HttpResponseRedirect
 from django.utils.module_loading import import_string
 
-from cms.cms_plugins import AliasPlugin
-from cms.models import CMSPlugin
-from cms.utils.plugins import downcast_plugins
+from cms.models import AliasPluginModel, CMSPlugin
 
 from .action_backends_base import BaseAction
-from .compat import build_plugin_tree
-from .constants import ALDRYN_FORMS_ACTION_BACKEND_KEY_MAX_SIZE, DEFAULT_ALDRYN_FORMS_ACTION_BACKENDS
+from .compat import CMS_PLUGIN_TREE_ORDERING, PageContent
+from .constants import (
+    ALDRYN_FORMS_ACTION_BACKEND_KEY_MAX_SIZE, ALDRYN_FORMS_SUCCESS_PARAM, DEFAULT_ALDRYN_FORMS_ACTION_BACKENDS,
+    DEFAULT_ALDRYN_FORMS_CACHEABLE_RENDER,
+)
+from .helpers import get_plugin_role, is_form_element
+
+
+# Relations needed to build and render form plugins,
+# fetched together with the plugins when downcasting.
+DOWNCAST_SELECT_RELATED = ('upload_to', 'redirect_page')
+
+
+def is_cacheable_render_enabled():
+    return getattr(settings, 'ALDRYN_FORMS_CACHEABLE_RENDER', DEFAULT_ALDRYN_FORMS_CACHEABLE_RENDER)
+
+
+def is_cacheable_render(request):
+    """
+    Returns whether the forms rendered for this request may be stored
+    in the placeholder and page caches of the CMS.
+
+    Only GET requests qualify, submissions and the pages they
+    are redirected to always render the form anew.
+    """
+    return (
+        is_cacheable_render_enabled()
+        and request.method in ('GET', 'HEAD')  # noqa: W503
+        and ALDRYN_FORMS_SUCCESS_PARAM not in request.GET  # noqa: W503
+    )
+
+
+class HttpResponseSeeOther(HttpResponseRedirect):
+    status_code = 303
+
+
+def get_success_redirect_url(request, form_plugin, success_url=None):
+    """
+    Returns where a successful submission of the form is redirected to.
+
+    Forms without a success URL are redirected to the submitted page,
+    which shows the success message of the form.
+    """
+    if success_url:
+        return success_url
+    query = request.GET.copy()
+    query[ALDRYN_FORMS_SUCCESS_PARAM] = form_plugin.pk
+    return '{}?{}'.format(request.path, query.urlencode())
+
+
+def is_success_redirect(request, form_plugin=None):
+    """Returns whether the request was redirected to after a successful submission of the form."""
+    submitted_form_id = request.GET.get(ALDRYN_FORMS_SUCCESS_PARAM)
+
+    if form_plugin is None:
+        return submitted_form_id is not None
+    return submitted_form_id == str(form_plugin.pk)
 
 
 def get_action_backends():
@@ -66,10 +128,12 @@ def get_user_model():
     return User
 
 
-def get_nested_plugins(parent_plugin, include_self=False):
-    """
-    Returns a flat list of plugins from parent_plugin. Replace AliasPlugin by descendants.
-    """
+def is_alias(plugin):
+    role = get_plugin_role(plugin.plugin_type)
+    return role is not None and role.is_alias
+
+
+def _get_nested_plugins(parent_plugin, include_self):
     found_plugins = []
 
     if include_self:
@@ -78,41 +142,432 @@ def get_nested_plugins(parent_plugin, include_self=False):
     child_plugins = getattr(parent_plugin, 'child_plugin_instances', None) or []
 
     for plugin in child_plugins:
-        if issubclass(plugin.get_plugin_class(), AliasPlugin):
-            if hasattr(plugin, "plugin"):
-                found_plugins.extend(list(plugin.plugin.get_descendants().order_by('path')))
-            else:
-                found_plugins.extend(list(plugin.get_descendants().order_by('path')))
+        if is_alias(plugin):
+            found_plugins.append(plugin)
         else:
-            found_plugins.extend(get_nested_plugins(plugin, include_self=True))
+            found_plugins.extend(_get_nested_plugins(plugin, include_self=True))
 
     return found_plugins
 
 
+def get_nested_plugins(parent_plugin, include_self=False):
+    """
+    Returns a flat list of plugins from parent_plugin. Replace AliasPlugin by the aliased plugins.
+
+    The aliased plugins of all aliases are loaded together. A source aliased
+    more than once is included only once.
+    """
+    return get_nested_plugins_by_parent([parent_plugin], include_self)[parent_plugin.pk]
+
+
+def get_nested_plugins_by_parent(parent_plugins, include_self=False):
+    """
+    Returns get_nested_plugins() of each of the given plugins, keyed by the plugin id.
+
+    The aliased plugins of all parent plugins are loaded together.
+    """
+    found_plugins = {parent.pk: _get_nested_plugins(parent, include_self) for parent in parent_plugins}
+    aliases = {
+        plugin.pk: plugin
+        for plugins in found_plugins.values()
+        for plugin in plugins if is_alias(plugin)
+    }
+
+    if not aliases:
+        return found_plugins
+
+    if not all(hasattr(alias, 'plugin_id') for alias in aliases.values()):
+        aliases = {alias.pk: alias for alias in downcast_form_plugins(aliases.values())}
+
+    aliased_plugins = get_aliased_plugins(aliases.values())
+    nested_plugins_by_parent = {}
+
+    for parent_id, plugins in found_plugins.items():
+        nested_plugins = []
+        included_sources = set()
+
+        for plugin in plugins:
+            if not is_alias(plugin):
+                nested_plugins.append(plugin)
+                continue
+
+            if plugin.pk not in aliases:
+                continue
+
+            source = get_alias_source(aliases[plugin.pk])
+
+            if source not in included_sources:
+                included_sources.add(source)
+                nested_plugins.extend(aliased_plugins.get(source, []))
+        nested_plugins_by_parent[parent_id] = nested_plugins
+    return nested_plugins_by_parent
+
+
+def get_alias_source(alias):
+    if alias.plugin_id:
+        return ('plugin', alias.plugin_id)
+    return ('placeholder', alias.alias_placeholder_id, alias.language)
+
+
+def get_aliased_plugins(aliases):
+    """
+    Returns the plugins referenced by the given (downcasted) aliases, in tree order,
+    keyed by get_alias_source.
+
+    An aliased plugin is returned together with its descendants, an aliased placeholder
+    with all its plugins. Each source is loaded once, on django CMS 3 all of them
+    in a single query using the treebeard ``path`` prefixes.
+    """
+    targets = {alias.plugin_id: alias.plugin for alias in aliases if alias.plugin_id}
+    placeholder_sources = {
+        get_alias_source(alias) for alias in aliases
+        if not alias.plugin_id and alias.alias_placeholder_id
+    }
+    conditions = [
+        Q(placeholder_id=placeholder_id, language=language)
+        for _, placeholder_id, language in placeholder_sources
+    ]
+
+    if CMS_PLUGIN_TREE_ORDERING == 'path':
+        conditions += [
+            Q(path__startswith=target.path) for target in targets.values()
+        ]
+    else:
+        descendant_ids = [target.pk for target in targets.values()]
+
+        for target in targets.values():
+            descendant_ids += target.get_descendants().values_list('pk', flat=True)
+        conditions.append(Q(pk__in=descendant_ids))
+
+    if not conditions:
+        return {}
+
+    plugins = list(CMSPlugin.objects.filter(reduce(or_, conditions)).order_by(CMS_PLUGIN_TREE_ORDERING))
+    plugins_by_id = {plugin.pk: plugin for plugin in plugins}
+    aliased_plugins = defaultdict(list)
+
+    for plugin in plugins:
+        for _, placeholder_id, language in placeholder_sources:
+            if plugin.placeholder_id == placeholder_id and plugin.language == language:
+                aliased_plugins[('placeholder', placeholder_id, language)].append(plugin)
+
+        # Walk up to every aliased plugin which contains this plugin.
+        ancestor = plugin
+
+        while ancestor is not None:
+            if ancestor.pk in targets:
+                aliased_plugins[('plugin', ancestor.pk)].append(plugin)
+            ancestor = plugins_by_id.get(ancestor.parent_id)
+    return aliased_plugins
+
+
+def get_plugin_descendants(plugin):
+    """
+    Returns a queryset of all plugins below the given plugin, in tree order.
+
+    On django CMS 3 this is a single query using the treebeard ``path`` prefix.
+    """
+    if CMS_PLUGIN_TREE_ORDERING == 'path':
+        queryset = CMSPlugin.objects.filter(path__startswith=plugin.path, depth__gt=plugin.depth)
+    else:
+        queryset = plugin.get_descendants()
+    return queryset.order_by(CMS_PLUGIN_TREE_ORDERING)
+
+
+def get_descendants_by_plugin(plugins):
+    """
+    Returns the descendants of each of the given plugins in tree order, keyed by the plugin id.
+
+    The descendants of all plugins are loaded in a single query.
+    """
+    plugins = {plugin.pk: plugin for plugin in plugins}
+
+    if not plugins:
+        return {}
+
+    if CMS_PLUGIN_TREE_ORDERING == 'path':
+        conditions = [Q(path__startswith=plugin.path, depth__gt=plugin.depth) for plugin in plugins.values()]
+    else:
+        conditions = [Q(placeholder_id=plugin.placeholder_id, language=plugin.language) for plugin in plugins.values()]
+
+    candidates = [
+        plugin for plugin in CMSPlugin.objects.filter(reduce(or_, conditions)).order_by(CMS_PLUGIN_TREE_ORDERING)
+        if plugin.pk not in plugins
+    ]
+    plugins_by_id = {plugin.pk: plugin for plugin in candidates}
+    plugins_by_id.update(plugins)
+    descendants = defaultdict(list)
+
+    for plugin in candidates:
+        # Walk up to the given plugin which contains this plugin, if any.
+        ancestor = plugins_by_id.get(plugin.parent_id)
+
+        while ancestor is not None and ancestor.pk not in plugins:
+            ancestor = plugins_by_id.get(ancestor.parent_id)
+
+        if ancestor is not None:
+            descendants[ancestor.pk].append(plugin)
+    return descendants
+
+
+def get_plugin_ancestors(plugin):
+    """
+    Returns the plugins above the given plugin, the direct parent first.
+
+    On django CMS 3 this is a single query for the prefixes of the treebeard ``path``.
+    """
+    if CMS_PLUGIN_TREE_ORDERING == 'path':
+        steplen = CMSPlugin.steplen
+        paths = [plugin.path[:length] for length in range(steplen, len(plugin.path), steplen)]
+        return list(CMSPlugin.objects.filter(path__in=paths).order_by('-path'))
+
+    candidates = CMSPlugin.objects.filter(placeholder_id=plugin.placeholder_id, language=plugin.language)
+    plugins_by_id = {candidate.pk: candidate for candidate in candidates}
+    ancestors = []
+    ancestor = plugins_by_id.get(plugin.parent_id)
+
+    while ancestor is not None:
+        ancestors.append(ancestor)
+        ancestor = plugins_by_id.get(ancestor.parent_id)
+    return ancestors
+
+
+def get_parent_form_plugin(plugin):
+    """
+    Returns the (downcasted) form plugin enclosing the given plugin, None if there is none.
+
+    Fields in fieldsets are found as well. A plugin outside of any form which
+    is aliased into a form belongs to the form of the first alias found.
+    The result is memoized on the plugin instance.
+    """
+    try:
+        return plugin._aldryn_forms_parent_form
+    except AttributeError:
+        pass
+
+    plugin._aldryn_forms_parent_form = _get_parent_form_plugin(plugin, visited_alias_ids=set())
+    return plugin._aldryn_forms_parent_form
+
+
+def _get_parent_form_plugin(plugin, visited_alias_ids):
+    ancestors = get_plugin_ancestors(plugin)
+    form_plugin = next(
+        (ancestor for ancestor in ancestors if getattr(get_plugin_role(ancestor.plugin_type), 'is_form', False)),
+        None,
+    )
+
+    if form_plugin is not None:
+        return form_plugin.get_plugin_instance()[0]
+
+    aliases = AliasPluginModel.objects.filter(
+        Q(plugin_id__in=[plugin.pk] + [ancestor.pk for ancestor in ancestors])
+        | Q(alias_placeholder_id=plugin.placeholder_id, language=plugin.language)  # noqa: W503
+    ).exclude(pk__in=visited_alias_ids).order_by('pk')
+
+    for alias in aliases:
+        # Placeholders may alias each other.
+        if alias.pk in visited_alias_ids:
+            continue
+        visited_alias_ids.add(alias.pk)
+        form_plugin = _get_parent_form_plugin(alias, visited_alias_ids)
+
+        if form_plugin is not None:
+            return form_plugin
+    return None
+
+
+def get_downcast_related_fields(model):
+    return [name for name in DOWNCAST_SELECT_RELATED if hasattr(model, name)]
+
+
+def _downcast_by_type(plugins):
+    downcasted = {}
+    pks_by_class = defaultdict(list)
+
+    for plugin in plugins:
+        role = get_plugin_role(plugin.plugin_type)
+
+        if role is None:
+            # The plugin is no longer registered.
+            continue
+
+        if plugin.__class__ is role.model:
+            downcasted[plugin.pk] = plugin
+        else:
+            pks_by_class[role.plugin_class].append(plugin.pk)
+
+    for plugin_class, pks in pks_by_class.items():
+        queryset = plugin_class.get_render_queryset().filter(pk__in=pks)
+        related_fields = get_downcast_related_fields(plugin_class.model)
+
+        if related_fields:
+            queryset = queryset.select_related(*related_fields)
+
+        for instance in queryset:
+            downcasted[instance.pk] = instance
+    return downcasted
+
+
+def downcast_form_plugins(plugins):
+    """
+    Returns the given plugins as instances of their plugin models.
+
+    Plugins are fetched with one query per plugin type, together with the
+    relations forms need (upload folders, redirect pages).
+    Plugins which already are model instances are kept as they are.
+    Targets of aliases are downcasted the same way and set on the alias.
+    Plugins which can't be downcasted, or whose parent can't, are left out.
+    """
+    plugins = list(plugins)
+    plugin_ids = {plugin.pk for plugin in plugins}
+    downcasted = _downcast_by_type(plugins)
+
+    aliases = [
+        instance for instance in downcasted.values()
+        if is_alias(instance) and instance.plugin_id
+    ]
+    if aliases:
+        downcasted_targets = _downcast_by_type(alias.plugin for alias in aliases)
+        for alias in aliases:
+            if alias.plugin_id in downcasted_targets:
+                alias.plugin = downcasted_targets[alias.plugin_id]
+
+    instances = []
+
+    for plugin in plugins:
+        # The plugin either has no parent or needs to have a non-ghost parent
+        parent_available = plugin.parent_id in plugin_ids
+        valid_parent = not parent_available or plugin.parent_id in downcasted
+
+        if valid_parent and plugin.pk in downcasted:
+            instances.append(downcasted[plugin.pk])
+    return instances
+
+
+def attach_child_plugins(plugin, descendants):
+    """
+    Sets child_plugin_instances of the given plugin and of its descendants,
+    which must be given in tree order.
+    """
+    children = defaultdict(list)
+
+    for descendant in descendants:
+        children[descendant.parent_id].append(descendant)
+
+    for parent in chain([plugin], descendants):
+        parent.child_plugin_instances = children.get(parent.pk, [])
+
+
 def get_plugin_tree(model, **kwargs):
     """
     Plugins in django CMS are highly related to a placeholder.
 
     This function builds a plugin tree for a plugin with no placeholder context.
 
-    Makes as many database queries as many levels are in the tree.
+    The whole subtree is loaded at once and assembled in memory,
+    so the number of queries does not depend on the depth of the tree.
+    """
+    plugin = model.objects.select_related(*get_downcast_related_fields(model)).get(**kwargs)
+    attach_child_plugins(plugin, downcast_form_plugins(get_plugin_descendants(plugin)))
+    return plugin
+
+
+def prefetch_form_elements(form_plugins):
+    """
+    Loads the form elements of all given form plugins together.
+
+    The subtrees, aliased plugins and options of all forms are fetched at once,
+    so the number of queries does not depend on the number of forms.
+    Forms which already have their plugin tree keep it.
+    """
+    form_plugins = [plugin for plugin in form_plugins if plugin._compiled_form is None]
+    form_plugins_without_tree = [plugin for plugin in form_plugins if plugin.child_plugin_instances is None]
+    descendants = get_descendants_by_plugin(form_plugins_without_tree)
+    descendant_instances = {
+        plugin.pk: plugin
+        for plugin in downcast_form_plugins(chain.from_iterable(descendants.values()))
+    }
+    trees = {plugin.pk: plugin for plugin in form_plugins}
+
+    for form_plugin in form_plugins_without_tree:
+        # Build the plugin tree on a copy, the instance may be shared.
+        tree = trees[form_plugin.pk] = copy.copy(form_plugin)
+        attach_child_plugins(tree, [
+            descendant_instances[plugin.pk] for plugin in descendants.get(form_plugin.pk, [])
+            if plugin.pk in descendant_instances
+        ])
+
+    nested_plugins = get_nested_plugins_by_parent(trees.values())
+    unique_plugins = {
+        plugin.pk: plugin
+        for plugins in nested_plugins.values()
+        for plugin in plugins
+    }
+    instances = {plugin.pk: plugin for plugin in downcast_form_plugins(unique_plugins.values())}
+    form_elements = {}
 
-    This is ok as forms shouldn't form very deep trees.
+    for form_plugin in form_plugins:
+        elements = [
+            instances[plugin.pk] for plugin in nested_plugins[form_plugin.pk]
+            if plugin.pk in instances and is_form_element(instances[plugin.pk])
+        ]
+        form_elements.update((plugin.pk, plugin) for plugin in elements)
+        form_plugin._compiled_form = form_plugin.compile_form(form_elements=elements)
+
+    plugins_with_options = [plugin for plugin in form_elements.values() if hasattr(plugin, 'option_set')]
+    prefetch_related_objects(plugins_with_options, 'option_set')
+
+
+def get_page_form_plugins(request, placeholder=None):
+    """
+    Returns the form plugins the CMS has loaded to render the current page,
+    with their plugin trees.
+
+    These are the forms on the given placeholder and on the placeholders
+    of the current page preloaded by the content renderer.
+    """
+    placeholders = [placeholder] if placeholder is not None else []
+    page = getattr(request, 'current_page', None)
+    toolbar = getattr(request, 'toolbar', None)
+
+    if page and toolbar is not None:
+        renderer = toolbar.get_content_renderer()
+        page_placeholders = getattr(renderer, '_placeholders_by_page_cache', {}).get(page.pk, {})
+        placeholders.extend(page_placeholders.values())
+
+    form_plugins = {}
+
+    for placeholder in placeholders:
+        for plugin in getattr(placeholder, '_all_plugins_cache', None) or []:
+            role = get_plugin_role(plugin.plugin_type)
+
+            if role is not None and role.is_form and plugin.__class__ is role.model:
+                form_plugins[plugin.pk] = plugin
+    return list(form_plugins.values())
+
+
+def get_request_form_manifests(request):
+    """
+    Returns the form manifests fetched while handling the given request, keyed by the form plugin id.
+    """
+    manifests = getattr(request, '_aldryn_forms_manifests', None)
+
+    if manifests is None:
+        manifests = request._aldryn_forms_manifests = {}
+    return manifests
+
+
+def get_public_form_plugins():
+    """
+    Returns form plugins placed on public pages.
     """
-    plugin = model.objects.get(**kwargs)
-    plugin.parent = None
-    current_level = [plugin]
-    plugin_list = [plugin]
-    while get_next_level(current_level).exists():
-        current_level = get_next_level(current_level)
-        current_level = downcast_plugins(current_level)
-        plugin_list += current_level
-    return build_plugin_tree(plugin_list)[0]
+    from .models import FormPlugin
 
+    queryset = FormPlugin.objects.order_by('pk')
 
-def get_next_level(current_level):
-    all_plugins = CMSPlugin.objects.all()
-    return all_plugins.filter(parent__in=[x.pk for x in current_level])
+    if PageContent is None:
+        return queryset.filter(placeholder__page__publisher_is_draft=False)
+    return queryset.filter(placeholder__content_type=ContentType.objects.get_for_model(PageContent))
 
 
 def add_form_error(form, message, field=NON_FIELD_ERRORS):
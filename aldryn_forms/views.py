@@ -1,9 +1,10 @@
-from django.http import HttpResponseBadRequest, HttpResponseRedirect
+from django.http import HttpResponseBadRequest
 from django.shortcuts import render
 from django.urls import resolve
 
 from .models import FormPlugin
-from .utils import get_plugin_tree
+from .registry import can_submit_form
+from .utils import HttpResponseSeeOther, get_plugin_tree, get_success_redirect_url
 
 
 try:
@@ -33,10 +34,12 @@ def submit_form_view(request):
             # fail if plugin_id has been tampered with
             return HttpResponseBadRequest()
 
+        if not can_submit_form(request, form_plugin_id):
+            # Unknown or unpublished form. The page of the form isn't checked,
+            # forms on static placeholders or using the form action are submitted to other pages.
+            return HttpResponseBadRequest()
+
         try:
-            # I believe this could be an issue as we don't check if the form submitted
-            # is in anyway tied to this page.
-            # But then we have a problem with static placeholders :(
             form_plugin = get_plugin_tree(FormPlugin, pk=form_plugin_id)
         except FormPlugin.DoesNotExist:
             return HttpResponseBadRequest()
@@ -46,6 +49,6 @@ def submit_form_view(request):
         form = form_plugin_instance.process_form(form_plugin, request)
         success_url = form_plugin_instance.get_success_url(instance=form_plugin)
 
-        if form.is_valid() and success_url:
-            return HttpResponseRedirect(success_url)
+        if form.is_valid():
+            return HttpResponseSeeOther(get_success_redirect_url(request, form_plugin, success_url))
     return render(request, template, context)
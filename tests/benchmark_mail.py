@@ -0,0 +1,92 @@
+"""
+Compares sending the emails of submissions with and without the SMTP connection pool.
+
+Not part of the test suite, run with::
+
+    python tests/settings.py test tests.benchmark_mail
+"""
+import socketserver
+import threading
+import time
+
+from django.core.mail import EmailMessage
+from django.test import SimpleTestCase
+
+from aldryn_forms.mail import connection_pool, send_messages
+
+
+# Stands in for the TCP, TLS and AUTH round trips to a remote mail server.
+CONNECT_LATENCY = 0.02
+# A staff notification, a confirmation and an email notification.
+EMAILS_PER_SUBMISSION = 3
+ITERATIONS = 20
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    """Accepts every email, just enough SMTP for the SMTP backend of Django."""
+
+    def handle(self):
+        time.sleep(CONNECT_LATENCY)
+        self.reply(b'220 localhost')
+
+        for line in self.rfile:
+            command = line[:4].upper()
+
+            if command == b'DATA':
+                self.reply(b'354 End data with <CR><LF>.<CR><LF>')
+
+                for data in self.rfile:
+                    if data == b'.\r\n':
+                        break
+                self.reply(b'250 OK')
+            elif command == b'QUIT':
+                self.reply(b'221 Bye')
+                return
+            else:
+                self.reply(b'250 OK')
+
+    def reply(self, line):
+        self.wfile.write(line + b'\r\n')
+
+
+class SMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+
+
+class MailBenchmark(SimpleTestCase):
+
+    def setUp(self):
+        self.server = SMTPServer(('127.0.0.1', 0), SMTPHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.addCleanup(connection_pool.clear)
+
+    def submit(self):
+        for index in range(EMAILS_PER_SUBMISSION):
+            send_messages([EmailMessage(f'email {index}', 'body', 'forms@example.com', ['user@example.com'])])
+
+    def measure(self, pool_size):
+        with self.settings(ALDRYN_FORMS_SMTP_POOL_SIZE=pool_size):
+            # Fills the pool.
+            self.submit()
+
+            start = time.perf_counter()
+            for _ in range(ITERATIONS):
+                self.submit()
+            return (time.perf_counter() - start) / ITERATIONS
+
+    def test_per_submission_latency(self):
+        host, port = self.server.server_address
+
+        with self.settings(
+            EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend', EMAIL_HOST=host, EMAIL_PORT=port,
+        ):
+            unpooled = self.measure(pool_size=0)
+            pooled = self.measure(pool_size=1)
+
+        print(
+            f'{EMAILS_PER_SUBMISSION} emails per submission, {CONNECT_LATENCY * 1000:.0f}ms to connect: '
+            f'without pool {unpooled * 1000:.2f}ms, with pool {pooled * 1000:.2f}ms, '
+            f'saved {(unpooled - pooled) * 1000:.2f}ms per submission'
+        )
@@ -0,0 +1,86 @@
+"""
+Compares rendering forms through the CMS with the single-pass FormRenderer.
+
+Not part of the test suite, run with::
+
+    python tests/settings.py test tests.benchmark_rendering
+"""
+import copy
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.test import RequestFactory, override_settings
+
+from cms.api import add_plugin
+from cms.models import Placeholder
+from cms.plugin_rendering import ContentRenderer
+from cms.test_utils.testcases import CMSTestCase
+
+from sekizai.context import SekizaiContext
+
+from aldryn_forms.models import FormPlugin
+from aldryn_forms.utils import get_plugin_tree
+
+
+FIELD_COUNTS = (10, 50, 100)
+ITERATIONS = 20
+
+
+def get_cached_templates():
+    # Templates are parsed once in production.
+    templates = copy.deepcopy(settings.TEMPLATES)
+    options = templates[0]['OPTIONS']
+    options['loaders'] = [('django.template.loaders.cached.Loader', options['loaders'])]
+    return templates
+
+
+class RenderingBenchmark(CMSTestCase):
+
+    def create_form(self, field_count):
+        placeholder = Placeholder.objects.create(slot='benchmark')
+        form_plugin = add_plugin(placeholder, 'FormPlugin', 'en')
+
+        for index in range(field_count):
+            add_plugin(
+                placeholder, 'TextField', 'en', target=form_plugin, name=f'field_{index}', label=f'Field {index}')
+        add_plugin(placeholder, 'SubmitButton', 'en', target=form_plugin, label='Submit')
+        return get_plugin_tree(FormPlugin, pk=form_plugin.pk)
+
+    def render(self, form_plugin):
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        request.session = {}
+        request.current_page = None
+        renderer = ContentRenderer(request)
+
+        start = time.perf_counter()
+        for _ in range(ITERATIONS):
+            renderer.render_plugin(form_plugin, SekizaiContext({'request': request}), editable=False)
+        return (time.perf_counter() - start) / ITERATIONS
+
+    def test_per_field_overhead(self):
+        with self.settings(TEMPLATES=get_cached_templates()):
+            self.measure()
+
+    def measure(self):
+        durations = {}
+
+        for field_count in FIELD_COUNTS:
+            form_plugin = self.create_form(field_count)
+            # Warms up the caches of forms and templates.
+            self.render(form_plugin)
+
+            with override_settings(ALDRYN_FORMS_SINGLE_PASS_RENDER=False):
+                cms = self.render(form_plugin)
+            with override_settings(ALDRYN_FORMS_SINGLE_PASS_RENDER=True):
+                single_pass = self.render(form_plugin)
+
+            durations[field_count] = cms, single_pass
+            print(f'{field_count:>4} fields: CMS {cms * 1000:.2f}ms, single pass {single_pass * 1000:.2f}ms')
+
+        fewest, most = min(FIELD_COUNTS), max(FIELD_COUNTS)
+        per_field = [
+            (durations[most][index] - durations[fewest][index]) / (most - fewest) * 1000000 for index in range(2)
+        ]
+        print(f'Per field: CMS {per_field[0]:.0f}µs, single pass {per_field[1]:.0f}µs')
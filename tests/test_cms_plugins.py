@@ -1,10 +1,30 @@
-from django.contrib.auth.models import User
+import re
+from unittest import mock
+
+from django.contrib.auth.models import AnonymousUser, User
 from django.core import mail
+from django.template import TemplateDoesNotExist
+from django.template.autoreload import get_template_directories
+from django.template.loader import select_template
+from django.test import RequestFactory, override_settings
+from django.utils.autoreload import file_changed
 
 from cms.api import add_plugin, create_page
+from cms.models import Placeholder
+from cms.plugin_rendering import ContentRenderer
 from cms.test_utils.testcases import CMSTestCase
 
-from aldryn_forms.models import FormSubmission
+from filer.models import Folder
+from sekizai.context import SekizaiContext
+
+from aldryn_forms.cache import (
+    FORM_MANIFEST_GENERATION_KEY, build_form_manifest, form_class_cache, get_form_manifest, get_form_manifest_cache_key,
+    get_manifest_cache, get_manifest_generation, invalidate_form_manifests, prefetch_form_manifests, template_cache,
+)
+from aldryn_forms.cms_plugins import EmailField
+from aldryn_forms.models import FormPlugin, FormSubmission, Option
+from aldryn_forms.rendering import FormRenderer
+from aldryn_forms.utils import get_plugin_tree
 from tests.test_views import CMS_3_11
 
 
@@ -123,3 +143,483 @@ class EmailNotificationFormPluginTestCase(CMSTestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(FormSubmission.objects.count(), 0)
         self.assertEqual(len(mail.outbox), 0)
+
+
+class FormClassCacheTestCase(CMSTestCase):
+    def setUp(self):
+        super().setUp()
+        form_class_cache.clear()
+        self.placeholder = Placeholder.objects.create(slot='test')
+        self.form_plugin = add_plugin(self.placeholder, 'FormPlugin', 'en', name='form')
+        self.field = add_plugin(self.placeholder, 'TextField', 'en', target=self.form_plugin, name='text', label='Text')
+
+    def get_form_class(self):
+        form_plugin = get_plugin_tree(FormPlugin, pk=self.form_plugin.pk)
+        return form_plugin.get_plugin_class_instance().get_form_class(form_plugin)
+
+    def test_form_class_is_reused(self):
+        self.assertIs(self.get_form_class(), self.get_form_class())
+        self.assertEqual(len(form_class_cache), 1)
+
+    def test_changed_field_rebuilds_form_class(self):
+        form_class = self.get_form_class()
+
+        self.field.label = 'Changed'
+        self.field.save()
+
+        self.assertEqual(len(form_class_cache), 0)
+        self.assertEqual(self.get_form_class().base_fields['text'].label, 'Changed')
+        self.assertEqual(form_class.base_fields['text'].label, 'Text')
+
+    def test_added_field_rebuilds_form_class(self):
+        self.get_form_class()
+
+        add_plugin(self.placeholder, 'EmailField', 'en', target=self.form_plugin, name='email')
+
+        self.assertIn('email', self.get_form_class().base_fields)
+
+    def test_deleted_field_rebuilds_form_class(self):
+        self.get_form_class()
+
+        self.field.delete()
+
+        self.assertNotIn('text', self.get_form_class().base_fields)
+
+    def test_option_change_rebuilds_form_class(self):
+        select = add_plugin(self.placeholder, 'SelectField', 'en', target=self.form_plugin, name='select')
+        select.option_set.create(value='one')
+        self.assertEqual(len(self.get_form_class().base_fields['select'].choices), 2)
+
+        select.option_set.create(value='two')
+
+        self.assertEqual(len(form_class_cache), 0)
+
+    def test_option_change_in_other_process_rebuilds_form_class(self):
+        select = add_plugin(self.placeholder, 'SelectField', 'en', target=self.form_plugin, name='select')
+        select.option_set.create(value='one')
+        self.assertEqual(len(self.get_form_class().base_fields['select'].choices), 2)
+
+        # Another process only shares the invalidated manifests, not the form classes cached here.
+        with mock.patch.object(form_class_cache, 'invalidate'), self.captureOnCommitCallbacks(execute=True):
+            select.option_set.create(value='two')
+
+        self.assertEqual(len(self.get_form_class().base_fields['select'].choices), 3)
+
+    @override_settings(ALDRYN_FORMS_FORM_CLASS_CACHE_SIZE=1)
+    def test_least_recently_used_form_class_is_evicted(self):
+        other_form = add_plugin(self.placeholder, 'FormPlugin', 'en', name='other')
+        add_plugin(self.placeholder, 'TextField', 'en', target=other_form, name='other_text')
+        self.get_form_class()
+
+        other_form = get_plugin_tree(FormPlugin, pk=other_form.pk)
+        other_form.get_plugin_class_instance().get_form_class(other_form)
+
+        self.assertEqual(len(form_class_cache), 1)
+
+    @override_settings(ALDRYN_FORMS_FORM_CLASS_CACHE_SIZE=0)
+    def test_disabled(self):
+        self.assertIsNot(self.get_form_class(), self.get_form_class())
+
+
+class OptionFieldsTestCase(CMSTestCase):
+    def setUp(self):
+        super().setUp()
+        placeholder = Placeholder.objects.create(slot='test')
+        form_plugin = add_plugin(placeholder, 'FormPlugin', 'en')
+        self.options = {}
+
+        for plugin_type, name in [
+            ('SelectField', 'topic'),
+            ('RadioSelectField', 'contact'),
+            ('MultipleSelectField', 'products'),
+        ]:
+            field = add_plugin(placeholder, plugin_type, 'en', target=form_plugin, name=name, label=name)
+            self.options[name] = [
+                Option.objects.create(field=field, value=f'{name} {index}', position=index) for index in (2, 1, 3)
+            ]
+        self.form_plugin = get_plugin_tree(FormPlugin, pk=form_plugin.pk)
+        self.form_class = self.form_plugin.get_plugin_class_instance().get_form_class(self.form_plugin)
+
+    def get_form(self, **data):
+        data.update(language='en', form_plugin_id=self.form_plugin.pk)
+        return self.form_class(data=data, form_plugin=self.form_plugin, request=RequestFactory().post('/'))
+
+    def test_no_queries(self):
+        with self.assertNumQueries(0):
+            form = self.get_form(
+                topic=self.options['topic'][0].pk,
+                contact=self.options['contact'][2].pk,
+                products=[self.options['products'][2].pk, self.options['products'][0].pk],
+            )
+            html = form.as_p()
+            self.assertTrue(form.is_valid(), form.errors)
+            choices = form.get_serialized_field_choices()
+
+        self.assertInHTML(f'<option value="{self.options["topic"][1].pk}">topic 1</option>', html)
+        self.assertEqual(choices, [
+            ('topic', 'topic 2'),
+            ('contact', 'contact 3'),
+            ('products', 'products 2, products 3'),
+        ])
+
+    def test_invalid_choices(self):
+        form = self.get_form(topic=0, contact='', products=[self.options['topic'][0].pk])
+
+        self.assertFalse(form.is_valid())
+        self.assertEqual(form.errors['topic'], [
+            'Select a valid choice. That choice is not one of the available choices.'
+        ])
+        self.assertEqual(form.errors['products'], [
+            f'Select a valid choice. {self.options["topic"][0].pk} is not one of the available choices.'
+        ])
+        self.assertNotIn('contact', form.errors)
+        self.assertEqual(form.cleaned_data['contact'], None)
+
+
+class TemplateCacheTestCase(CMSTestCase):
+    def setUp(self):
+        super().setUp()
+        template_cache.clear()
+
+    def test_templates_are_selected_once(self):
+        placeholder = Placeholder.objects.create(slot='test')
+        form_plugin = add_plugin(placeholder, 'FormPlugin', 'en')
+        field = add_plugin(placeholder, 'TextField', 'en', target=form_plugin, name='name')
+        plugin = field.get_plugin_class_instance()
+        context = {'form': mock.Mock(form_plugin=form_plugin)}
+
+        with mock.patch('aldryn_forms.cache.select_template', wraps=select_template) as select:
+            template = plugin.get_render_template(context, field, placeholder)
+            self.assertIs(plugin.get_render_template(context, field, placeholder), template)
+
+        select.assert_called_once_with((
+            'aldryn_forms/formplugin/fields/textfield.html',
+            'aldryn_forms/fields/textfield.html',
+            'aldryn_forms/field.html',
+        ))
+        self.assertEqual(template.origin.template_name, 'aldryn_forms/fields/textfield.html')
+
+    def test_missing_templates_are_cached(self):
+        with mock.patch('aldryn_forms.cache.select_template', wraps=select_template) as select:
+            for _ in range(2):
+                with self.assertRaisesMessage(TemplateDoesNotExist, 'aldryn_forms/missing.html'):
+                    template_cache.select_template(['aldryn_forms/missing.html'])
+
+        select.assert_called_once()
+
+    def test_cleared_on_template_change(self):
+        template_cache.select_template(['aldryn_forms/field.html'])
+        template_directory = next(iter(get_template_directories()))
+
+        file_changed.send(sender=None, file_path=template_directory / 'aldryn_forms' / 'utils.py')
+        self.assertEqual(len(template_cache), 1)
+
+        file_changed.send(sender=None, file_path=template_directory / 'aldryn_forms' / 'field.html')
+        self.assertEqual(len(template_cache), 0)
+
+
+class FormManifestTestCase(CMSTestCase):
+    def setUp(self):
+        super().setUp()
+        self.placeholder = Placeholder.objects.create(slot='test')
+        self.form_plugin = add_plugin(self.placeholder, 'FormPlugin', 'en', name='form')
+        add_plugin(self.placeholder, 'TextField', 'en', target=self.form_plugin, name='text')
+        select = add_plugin(self.placeholder, 'SelectField', 'en', target=self.form_plugin, name='select')
+        select.option_set.create(value='one')
+
+    def test_manifest_is_shared_through_the_cache(self):
+        manifest = get_form_manifest(get_plugin_tree(FormPlugin, pk=self.form_plugin.pk))
+
+        with self.assertNumQueries(0):
+            cached_manifest = get_form_manifest(FormPlugin(pk=self.form_plugin.pk, language='en'))
+            self.assertEqual(
+                [option.value for option in cached_manifest.fields[1].plugin_instance.option_set.all()],
+                ['one'],
+            )
+
+        self.assertEqual([field.name for field in cached_manifest.fields], ['text', 'select'])
+        self.assertEqual(cached_manifest.version, manifest.version)
+
+    def test_manifest_is_invalidated_by_plugin_changes(self):
+        get_form_manifest(get_plugin_tree(FormPlugin, pk=self.form_plugin.pk))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            add_plugin(self.placeholder, 'EmailField', 'en', target=self.form_plugin, name='email')
+        manifest = get_form_manifest(FormPlugin.objects.get(pk=self.form_plugin.pk))
+
+        self.assertEqual([field.name for field in manifest.fields], ['text', 'select', 'email'])
+
+    def test_manifests_are_invalidated_on_commit(self):
+        generation = get_manifest_generation()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            add_plugin(self.placeholder, 'EmailField', 'en', target=self.form_plugin, name='email')
+
+            self.assertEqual(get_manifest_generation(), generation)
+
+        self.assertNotEqual(get_manifest_generation(), generation)
+
+    def test_stale_manifest_is_rebuilt(self):
+        get_form_manifest(get_plugin_tree(FormPlugin, pk=self.form_plugin.pk))
+
+        # Another process with its own manifest cache doesn't see the invalidation.
+        with mock.patch('aldryn_forms.signals.invalidate_form_manifests'):
+            with self.captureOnCommitCallbacks(execute=True):
+                add_plugin(self.placeholder, 'EmailField', 'en', target=self.form_plugin, name='email')
+        manifest = get_form_manifest(get_plugin_tree(FormPlugin, pk=self.form_plugin.pk))
+
+        self.assertEqual([field.name for field in manifest.fields], ['text', 'select', 'email'])
+
+    def test_waits_for_manifest_built_by_another_worker(self):
+        manifest = build_form_manifest(get_plugin_tree(FormPlugin, pk=self.form_plugin.pk))
+        cache_key = get_form_manifest_cache_key(self.form_plugin.pk, 'en')
+        cache = get_manifest_cache()
+        cache.add(f'{cache_key}:lock', True)
+
+        with mock.patch('aldryn_forms.cache.time.sleep', side_effect=lambda seconds: cache.set(cache_key, manifest)):
+            with self.assertNumQueries(0):
+                waited_manifest = get_form_manifest(FormPlugin(pk=self.form_plugin.pk, language='en'))
+
+        self.assertEqual(waited_manifest.version, manifest.version)
+        cache.delete(f'{cache_key}:lock')
+
+
+class PagePrefetchTestCase(CMSTestCase):
+    def setUp(self):
+        super().setUp()
+        self.page = create_page('test page', 'test_page.html', 'en')
+        if CMS_3_11:
+            placeholder = self.page.placeholders.get(slot='content')
+        else:  # 4.1
+            placeholder = self.page.pagecontent_set.get().placeholders.get(slot='content')
+
+        for name in ('newsletter', 'contact', 'callback'):
+            form_plugin = add_plugin(placeholder, 'FormPlugin', 'en', name=name)
+            add_plugin(placeholder, 'TextField', 'en', target=form_plugin, name=f'{name}_text')
+            add_plugin(placeholder, 'SubmitButton', 'en', target=form_plugin, label='Submit')
+
+        if CMS_3_11:
+            self.page.publish('en')
+        invalidate_form_manifests()
+
+    def test_manifests_of_all_forms_are_built_together(self):
+        with mock.patch(
+            'aldryn_forms.cms_plugins.prefetch_form_manifests', wraps=prefetch_form_manifests,
+        ) as prefetch:
+            response = self.client.get(self.page.get_absolute_url())
+
+        self.assertContains(response, 'callback_text')
+        prefetch.assert_called_once()
+        self.assertEqual(
+            sorted(plugin.name for plugin in prefetch.call_args[0][0]),
+            ['callback', 'contact', 'newsletter'],
+        )
+
+        with mock.patch('aldryn_forms.cms_plugins.prefetch_form_manifests') as prefetch:
+            self.client.get(self.page.get_absolute_url())
+
+        prefetch.assert_not_called()
+
+    def test_manifests_are_fetched_once(self):
+        self.client.get(self.page.get_absolute_url())
+        cache = get_manifest_cache()
+
+        with mock.patch.object(cache, 'get', wraps=cache.get) as cache_get:
+            response = self.client.get(self.page.get_absolute_url())
+
+        self.assertContains(response, 'callback_text')
+        manifest_keys = [
+            call.args[0] for call in cache_get.call_args_list
+            if call.args[0].startswith('aldryn_forms:manifest:') and call.args[0] != FORM_MANIFEST_GENERATION_KEY
+        ]
+        self.assertEqual(len(manifest_keys), 3)
+        self.assertEqual(len(set(manifest_keys)), 3)
+
+    def test_forms_on_a_placeholder_outside_the_page_are_built_together(self):
+        # Like a static placeholder, rendered without a page.
+        placeholder = Placeholder.objects.create(slot='footer')
+
+        for name in ('subscribe', 'feedback', 'support'):
+            form_plugin = add_plugin(placeholder, 'FormPlugin', 'en', name=name)
+            add_plugin(placeholder, 'TextField', 'en', target=form_plugin, name=f'{name}_text')
+
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        request.session = {}
+        request.current_page = None
+
+        with mock.patch(
+            'aldryn_forms.cms_plugins.prefetch_form_manifests', wraps=prefetch_form_manifests,
+        ) as prefetch:
+            content = ContentRenderer(request).render_placeholder(
+                placeholder, SekizaiContext({'request': request}), language='en', editable=False,
+            )
+
+        self.assertIn('support_text', content)
+        prefetch.assert_called_once()
+        self.assertEqual(
+            sorted(plugin.name for plugin in prefetch.call_args[0][0]),
+            ['feedback', 'subscribe', 'support'],
+        )
+
+
+class FileFieldSerializationTestCase(CMSTestCase):
+    def test_links_are_absolute_urls_of_the_request(self):
+        placeholder = Placeholder.objects.create(slot='test')
+        form_plugin = add_plugin(placeholder, 'FormPlugin', 'en', name='form')
+        folder = Folder.objects.create(name='uploads')
+        add_plugin(placeholder, 'FileField', 'en', target=form_plugin, name='upload', upload_to=folder)
+        field, = get_plugin_tree(FormPlugin, pk=form_plugin.pk).get_form_fields()
+        uploaded_file = mock.Mock(url='/media/cv.pdf', original_filename='cv.pdf')
+        form = mock.Mock(
+            request=RequestFactory().get('/'),
+            cleaned_data={'upload': [uploaded_file]},
+        )
+        plugin = field.plugin_instance.get_plugin_class_instance()
+
+        self.assertEqual(plugin.serialize_field(form, field).value, 'http://testserver/media/cv.pdf')
+        self.assertEqual(plugin.serialize_field(form, field, is_confirmation=True).value, 'cv.pdf')
+
+
+class ProcessFormTestCase(CMSTestCase):
+    def setUp(self):
+        super().setUp()
+        placeholder = Placeholder.objects.create(slot='test')
+        self.forms = []
+
+        for name in ('newsletter', 'contact'):
+            form_plugin = add_plugin(placeholder, 'FormPlugin', 'en', name=name)
+            add_plugin(placeholder, 'EmailField', 'en', target=form_plugin, name=f'{name}_email', required=True)
+            self.forms.append(get_plugin_tree(FormPlugin, pk=form_plugin.pk))
+
+        self.request = RequestFactory().post('/', {
+            'form_plugin_id': self.forms[1].pk,
+            'contact_email': 'invalid',
+        })
+
+    def process_form(self, form_plugin):
+        return form_plugin.get_plugin_class_instance().process_form(form_plugin, self.request)
+
+    def test_only_submitted_form_is_bound(self):
+        with mock.patch('aldryn_forms.cms_plugins.FormPlugin._process_form') as process:
+            form = self.process_form(self.forms[0])
+
+        process.assert_not_called()
+        self.assertFalse(form.is_bound)
+        self.assertFalse(form.errors)
+        self.assertNotIn('instance', form.__dict__)
+
+        form = self.process_form(self.forms[1])
+
+        self.assertTrue(form.is_bound)
+        self.assertIn('contact_email', form.errors)
+
+
+class SerializedFieldsTestCase(CMSTestCase):
+    def setUp(self):
+        super().setUp()
+        placeholder = Placeholder.objects.create(slot='test')
+        form_plugin = add_plugin(placeholder, 'FormPlugin', 'en', name='form', action_backend='default')
+        form_plugin.recipients.add(User.objects.create_user('staff', 'staff@example.com', 'password'))
+
+        for name in ('email', 'other_email'):
+            add_plugin(
+                placeholder, 'EmailField', 'en', target=form_plugin, name=name,
+                email_send_notification=True, email_subject='Thank you',
+            )
+        self.form_plugin = get_plugin_tree(FormPlugin, pk=form_plugin.pk)
+        self.request = RequestFactory().post('/', {
+            'form_plugin_id': self.form_plugin.pk,
+            'email': 'test@example.com',
+            'other_email': 'other@example.com',
+        })
+
+    def test_serialized_once_per_variant(self):
+        plugin = self.form_plugin.get_plugin_class_instance()
+
+        with mock.patch.object(
+            EmailField, 'serialize_field', autospec=True, side_effect=EmailField.serialize_field,
+        ) as serialize_field:
+            with self.captureOnCommitCallbacks(execute=True):
+                form = plugin.process_form(self.form_plugin, self.request)
+
+        self.assertFalse(form.errors)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(FormSubmission.objects.get().get_form_data(), form.get_serialized_fields())
+        # The availability check in clean() serializes the email fields on their own.
+        calls = [call.args[3] if len(call.args) > 3 else False for call in serialize_field.call_args_list]
+        self.assertEqual(calls.count(False), 4)
+        self.assertEqual(calls.count(True), 2)
+
+    def test_reset(self):
+        plugin = self.form_plugin.get_plugin_class_instance()
+        form = plugin.get_form_class(self.form_plugin)(**plugin.get_form_kwargs(self.form_plugin, self.request))
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual(form.get_cleaned_data()['email'], 'test@example.com')
+
+        form.cleaned_data['email'] = 'changed@example.com'
+
+        self.assertEqual(form.get_cleaned_data()['email'], 'test@example.com')
+        form.reset_serialized_fields()
+        self.assertEqual(form.get_cleaned_data()['email'], 'changed@example.com')
+
+
+class SinglePassRenderTestCase(CMSTestCase):
+    def setUp(self):
+        super().setUp()
+        page = create_page('test page', 'test_page.html', 'en')
+        if CMS_3_11:
+            placeholder = page.placeholders.get(slot='content')
+        else:  # 4.1
+            placeholder = page.pagecontent_set.get().placeholders.get(slot='content')
+
+        form_plugin = add_plugin(placeholder, 'FormPlugin', 'en', action_backend='none')
+        fieldset = add_plugin(placeholder, 'Fieldset', 'en', target=form_plugin, legend='Contact')
+        add_plugin(placeholder, 'TextField', 'en', target=fieldset, name='name', label='Name', required=True)
+        add_plugin(placeholder, 'EmailField', 'en', target=fieldset, name='email', label='E-mail', help_text='Help')
+        select = add_plugin(placeholder, 'SelectField', 'en', target=form_plugin, name='topic', label='Topic')
+        Option.objects.create(field=select, value='Sales', position=1)
+        Option.objects.create(field=select, value='Support', position=2, default_value=True)
+        add_plugin(placeholder, 'BooleanField', 'en', target=form_plugin, name='agree', label='Agree')
+        add_plugin(placeholder, 'TextPlugin', 'en', target=form_plugin, body='<p>Thank you</p>')
+        add_plugin(placeholder, 'SubmitButton', 'en', target=form_plugin, label='Send', custom_classes='button')
+        self.form_plugin = form_plugin
+
+        if CMS_3_11:
+            page.publish('en')
+            self.form_plugin = FormPlugin.objects.get(placeholder__page=page.publisher_public)
+        self.url = page.get_absolute_url('en')
+
+    def get_form_html(self, response):
+        content = response.content.decode()
+        content = re.sub(r'<input type="hidden" name="csrfmiddlewaretoken"[^>]*>', '', content)
+        return re.search(r'<form .*</form>', content, re.DOTALL).group(0)
+
+    def render(self, data=None):
+        with mock.patch.object(FormRenderer, 'render_plugin', side_effect=FormRenderer.render_plugin,
+                               autospec=True) as render_plugin:
+            with self.settings(ALDRYN_FORMS_SINGLE_PASS_RENDER=True):
+                if data is None:
+                    single_pass_response = self.client.get(self.url)
+                else:
+                    single_pass_response = self.client.post(self.url, data)
+
+        self.assertEqual(render_plugin.call_count, 7)
+
+        if data is None:
+            response = self.client.get(self.url)
+        else:
+            response = self.client.post(self.url, data)
+        return self.get_form_html(response), self.get_form_html(single_pass_response)
+
+    def test_same_html(self):
+        html, single_pass_html = self.render()
+
+        self.assertIn('<p>Thank you</p>', single_pass_html)
+        self.assertHTMLEqual(html, single_pass_html)
+
+    def test_same_html_with_errors(self):
+        html, single_pass_html = self.render({'form_plugin_id': self.form_plugin.pk, 'email': 'invalid'})
+
+        self.assertIn('errormessages', single_pass_html)
+        self.assertHTMLEqual(html, single_pass_html)
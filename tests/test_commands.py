@@ -0,0 +1,163 @@
+import os
+import smtplib
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.core import mail
+from django.core.mail import EmailMultiAlternatives
+from django.core.management import CommandError, call_command
+from django.test import override_settings
+from django.utils import timezone
+
+from cms.api import add_plugin, create_page
+from cms.test_utils.testcases import CMSTestCase
+
+from aldryn_forms.cache import get_form_manifest_cache_key, get_manifest_cache
+from aldryn_forms.mail import send_messages
+from aldryn_forms.models import OutboxEmail
+from tests.test_views import CMS_3_11
+
+
+class WarmAldrynFormsTestCase(CMSTestCase):
+    def setUp(self):
+        super().setUp()
+        page = create_page('test page', 'test_page.html', 'en')
+        if CMS_3_11:
+            placeholder = page.placeholders.get(slot='content')
+        else:  # 4.1
+            placeholder = page.pagecontent_set.get().placeholders.get(slot='content')
+
+        form_plugin = add_plugin(placeholder, 'FormPlugin', 'en', name='contact')
+        add_plugin(placeholder, 'EmailField', 'en', target=form_plugin, name='email')
+        add_plugin(placeholder, 'SubmitButton', 'en', target=form_plugin, label='Submit')
+        self.form_plugin = form_plugin
+
+        if CMS_3_11:
+            page.publish('en')
+            self.form_plugin = page.publisher_public.placeholders.get(slot='content').cmsplugin_set.get(
+                plugin_type='FormPlugin')
+            self.draft_form_plugin = form_plugin
+
+    def test_warm_up(self):
+        stdout = StringIO()
+
+        call_command('warm_aldryn_forms', workers=1, stdout=stdout)
+
+        manifest = get_manifest_cache().get(get_form_manifest_cache_key(self.form_plugin.pk, 'en'))
+        self.assertEqual([field.name for field in manifest.fields], ['email'])
+        self.assertIn(f'FormPlugin {self.form_plugin.pk} "contact" (en): ', stdout.getvalue())
+        self.assertIn('Warmed up 1 of 1 forms', stdout.getvalue())
+
+        if CMS_3_11:
+            draft_key = get_form_manifest_cache_key(self.draft_form_plugin.pk, 'en')
+            self.assertIsNone(get_manifest_cache().get(draft_key))
+
+    def test_slow_forms_fail(self):
+        with self.assertRaisesMessage(CommandError, 'took longer than 0'):
+            call_command('warm_aldryn_forms', workers=1, max_seconds=0, stdout=StringIO(), stderr=StringIO())
+
+
+@override_settings(ALDRYN_FORMS_EMAIL_OUTBOX=True)
+class SendAldrynFormsEmailsTestCase(CMSTestCase):
+    def setUp(self):
+        super().setUp()
+        message = EmailMultiAlternatives(
+            'Thank you', 'text', 'forms@example.com', ['user@example.com'], reply_to=['reply@example.com'],
+        )
+        message.attach_alternative('<p>html</p>', 'text/html')
+        send_messages([message], form_name='contact')
+        send_messages([EmailMultiAlternatives('New submission', 'text', to=['staff@example.com'])], form_name='order')
+
+    def call_command(self, *args, **kwargs):
+        stdout = StringIO()
+        call_command('send_aldryn_forms_emails', *args, stdout=stdout, stderr=StringIO(), **kwargs)
+        return stdout.getvalue()
+
+    def test_messages_are_stored(self):
+        self.assertEqual(mail.outbox, [])
+        email = OutboxEmail.objects.get(form_name='contact')
+        self.assertEqual(email.status, OutboxEmail.STATUS_PENDING)
+        self.assertEqual(email.to, ['user@example.com'])
+        self.assertEqual(email.html_body, '<p>html</p>')
+
+    def test_send(self):
+        output = self.call_command(batch_size=1)
+
+        self.assertEqual([message.subject for message in mail.outbox], ['Thank you', 'New submission'])
+        message = mail.outbox[0]
+        self.assertEqual(message.from_email, 'forms@example.com')
+        self.assertEqual(message.reply_to, ['reply@example.com'])
+        self.assertEqual(message.alternatives, [('<p>html</p>', 'text/html')])
+        self.assertFalse(OutboxEmail.objects.exclude(status=OutboxEmail.STATUS_SENT).exists())
+        self.assertIn('"contact": 1 sent, 0 to retry, 0 failed', output)
+        self.assertIn('Sent 2 emails', output)
+
+        self.call_command()
+
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_throughput_per_form(self):
+        # The run takes 10s, sending the email of "contact" 1s and the email of "order" 4s.
+        perf_counter = mock.Mock(side_effect=[0, 0, 1, 1, 5, 10])
+
+        with mock.patch('aldryn_forms.management.commands.send_aldryn_forms_emails.time.perf_counter', perf_counter):
+            output = self.call_command()
+
+        self.assertIn('"contact": 1 sent, 0 to retry, 0 failed, 1.0 emails/s', output)
+        self.assertIn('"order": 1 sent, 0 to retry, 0 failed, 0.2 emails/s', output)
+        self.assertIn('Sent 2 emails in 10.000s.', output)
+
+    def test_batch_is_claimed(self):
+        claimed = []
+
+        def send_messages(backend, messages):
+            claimed.append(OutboxEmail.objects.filter(next_attempt_at__gt=timezone.now()).count())
+            return len(messages)
+
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', send_messages):
+            self.call_command()
+
+        # Both emails are reserved while the first one is sent, the first one is saved right after.
+        self.assertEqual(claimed, [2, 1])
+        self.assertEqual(OutboxEmail.objects.filter(status=OutboxEmail.STATUS_SENT).count(), 2)
+
+    @mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages')
+    def test_retry_and_fail(self, send):
+        send.side_effect = smtplib.SMTPServerDisconnected('gone')
+
+        output = self.call_command(max_attempts=2)
+
+        self.assertIn('"contact": 0 sent, 1 to retry, 0 failed', output)
+        email = OutboxEmail.objects.get(form_name='contact')
+        self.assertEqual(email.status, OutboxEmail.STATUS_PENDING)
+        self.assertEqual(email.attempts, 1)
+        self.assertEqual(email.last_error, 'gone')
+        self.assertGreater(email.next_attempt_at, timezone.now())
+
+        # Not due yet.
+        self.call_command(max_attempts=2)
+        self.assertEqual(send.call_count, 2)
+
+        OutboxEmail.objects.update(next_attempt_at=timezone.now())
+        output = self.call_command(max_attempts=2)
+
+        self.assertIn('"contact": 0 sent, 0 to retry, 1 failed', output)
+        self.assertEqual(OutboxEmail.objects.filter(status=OutboxEmail.STATUS_FAILED).count(), 2)
+
+        send.side_effect = None
+        self.call_command(retry_failed=True)
+
+        self.assertEqual(OutboxEmail.objects.filter(status=OutboxEmail.STATUS_SENT).count(), 2)
+
+    def test_file_backend(self):
+        with tempfile.TemporaryDirectory() as directory:
+            backend = 'django.core.mail.backends.filebased.EmailBackend'
+
+            with self.settings(EMAIL_BACKEND=backend, EMAIL_FILE_PATH=directory):
+                self.call_command()
+
+            contents = ''.join(open(os.path.join(directory, name)).read() for name in os.listdir(directory))
+
+        self.assertIn('Subject: Thank you', contents)
+        self.assertIn('Subject: New submission', contents)
@@ -0,0 +1,70 @@
+from cms.api import add_plugin
+from cms.models import Placeholder
+from cms.plugin_pool import plugin_pool
+from cms.test_utils.testcases import CMSTestCase
+
+from aldryn_forms.cms_plugins import TextField
+from aldryn_forms.helpers import get_plugin_role, is_form_element, plugin_roles
+
+
+class CustomTextField(TextField):
+    name = 'Custom text field'
+
+
+class PluginRolesTestCase(CMSTestCase):
+
+    def setUp(self):
+        plugin_roles.clear()
+
+    def test_roles(self):
+        form = get_plugin_role('FormPlugin')
+        self.assertTrue(form.is_form_element)
+        self.assertTrue(form.is_container)
+        self.assertFalse(form.is_field)
+
+        text_field = get_plugin_role('TextField')
+        self.assertTrue(text_field.is_form_element)
+        self.assertTrue(text_field.is_field)
+        self.assertFalse(text_field.is_container)
+
+        submit_button = get_plugin_role('SubmitButton')
+        self.assertTrue(submit_button.is_submit_button)
+        self.assertFalse(submit_button.is_field)
+
+        alias = get_plugin_role('AliasPlugin')
+        self.assertTrue(alias.is_alias)
+        self.assertFalse(alias.is_form_element)
+
+        self.assertIsNone(get_plugin_role('UnknownPlugin'))
+
+    def test_roles_follow_plugin_pool(self):
+        self.assertIsNone(get_plugin_role('CustomTextField'))
+
+        plugin_pool.register_plugin(CustomTextField)
+
+        try:
+            role = get_plugin_role('CustomTextField')
+            self.assertIs(role.plugin_class, CustomTextField)
+            self.assertTrue(role.is_field)
+        finally:
+            plugin_pool.unregister_plugin(CustomTextField)
+
+        self.assertIsNone(get_plugin_role('CustomTextField'))
+
+    def test_is_form_element(self):
+        placeholder = Placeholder.objects.create(slot='test')
+        form = add_plugin(placeholder, 'FormPlugin', 'en')
+        field = add_plugin(placeholder, 'TextField', 'en', target=form, name='name')
+        text = add_plugin(placeholder, 'TextPlugin', 'en', body='text')
+
+        self.assertTrue(is_form_element(form))
+        self.assertTrue(is_form_element(field))
+        self.assertFalse(is_form_element(text))
+        # Not downcasted to the plugin model.
+        self.assertFalse(is_form_element(field.cmsplugin_ptr))
+
+        alias = add_plugin(placeholder, 'AliasPlugin', 'en', plugin=field)
+        self.assertTrue(is_form_element(alias))
+
+        alias = add_plugin(placeholder, 'AliasPlugin', 'en', plugin=text)
+        self.assertFalse(is_form_element(alias))
@@ -0,0 +1,304 @@
+import smtplib
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.mail import EmailMessage
+from django.test import override_settings
+
+from cms.api import add_plugin, create_page
+from cms.test_utils.testcases import CMSTestCase
+
+from aldryn_forms.mail import collect_messages, connection_pool, send_messages, send_messages_with_retries
+from aldryn_forms.models import FormSubmission, OutboxEmail
+from tests.test_views import CMS_3_11
+
+
+def get_messages(count=2):
+    return [EmailMessage(f'subject {index}', 'body', to=[f'user{index}@example.com']) for index in range(count)]
+
+
+class SendMessagesTestCase(CMSTestCase):
+
+    def setUp(self):
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        patcher = mock.patch('aldryn_forms.mail.get_sending_executor', return_value=self.executor)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.executor.shutdown)
+
+    def test_sent_immediately(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            send_messages(get_messages())
+
+        self.assertEqual(callbacks, [])
+        self.assertEqual([message.subject for message in mail.outbox], ['subject 0', 'subject 1'])
+
+    @override_settings(ALDRYN_FORMS_DEFERRED_SENDING=True)
+    def test_sent_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            send_messages(get_messages())
+
+            self.assertEqual(mail.outbox, [])
+
+        self.executor.shutdown(wait=True)
+        self.assertEqual([message.subject for message in mail.outbox], ['subject 0', 'subject 1'])
+
+    @override_settings(ALDRYN_FORMS_DEFERRED_SENDING=True)
+    def test_nothing_to_send(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            send_messages([])
+
+        self.assertEqual(callbacks, [])
+
+    @override_settings(ALDRYN_FORMS_DEFERRED_SENDING_RETRIES=2)
+    @mock.patch('aldryn_forms.mail.time.sleep')
+    def test_retries(self, sleep):
+        connection = mock.Mock()
+        connection.send_messages.side_effect = [smtplib.SMTPServerDisconnected(), 1]
+
+        with mock.patch('aldryn_forms.mail.get_connection', return_value=connection):
+            with self.assertLogs('aldryn_forms.mail', 'WARNING'):
+                send_messages_with_retries(get_messages(1))
+
+        self.assertEqual(connection.send_messages.call_count, 2)
+        sleep.assert_called_once_with(1)
+
+    @override_settings(ALDRYN_FORMS_DEFERRED_SENDING_RETRIES=2)
+    @mock.patch('aldryn_forms.mail.time.sleep')
+    def test_gives_up(self, sleep):
+        connection = mock.Mock()
+        connection.send_messages.side_effect = smtplib.SMTPServerDisconnected()
+
+        with mock.patch('aldryn_forms.mail.get_connection', return_value=connection):
+            with self.assertLogs('aldryn_forms.mail', 'ERROR'):
+                send_messages_with_retries(get_messages(1))
+
+        self.assertEqual(connection.send_messages.call_count, 3)
+        self.assertEqual([call.args for call in sleep.call_args_list], [(1,), (2,)])
+
+    @override_settings(ALDRYN_FORMS_DEFERRED_SENDING=True)
+    def test_form_submission(self):
+        page = create_page('test page', 'test_page.html', 'en')
+        if CMS_3_11:
+            placeholder = page.placeholders.get(slot='content')
+        else:
+            placeholder = page.pagecontent_set.get().placeholders.get(slot='content')
+
+        form_plugin = add_plugin(placeholder, 'FormPlugin', 'en', name='form', action_backend='email_only')
+        add_plugin(
+            placeholder, 'EmailField', 'en', target=form_plugin, name='email',
+            email_send_notification=True, email_subject='Thank you',
+        )
+        add_plugin(placeholder, 'SubmitButton', 'en', target=form_plugin, label='Submit')
+
+        if CMS_3_11:
+            page.publish('en')
+            form_plugin = page.publisher_public.placeholders.get(slot='content').cmsplugin_set.get(
+                plugin_type='FormPlugin',
+            )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(page.get_absolute_url('en'), {
+                'form_plugin_id': form_plugin.id,
+                'email': 'test@example.com',
+            })
+
+            self.assertEqual(mail.outbox, [])
+
+        self.executor.shutdown(wait=True)
+        # The form has no recipients, so no notification is sent to staff.
+        self.assertEqual([message.subject for message in mail.outbox], ['Thank you'])
+
+    def test_messages_without_recipients_are_not_sent(self):
+        send_messages([EmailMessage('subject', 'body')] + get_messages(1))
+
+        self.assertEqual([message.subject for message in mail.outbox], ['subject 0'])
+
+    @override_settings(ALDRYN_FORMS_EMAIL_OUTBOX=True)
+    def test_messages_without_recipients_are_not_stored(self):
+        send_messages([EmailMessage('subject', 'body')])
+
+        self.assertFalse(OutboxEmail.objects.exists())
+
+
+@override_settings(ALDRYN_FORMS_SMTP_POOL_SIZE=1)
+class ConnectionPoolTestCase(CMSTestCase):
+
+    def setUp(self):
+        connection_pool.clear()
+        self.addCleanup(connection_pool.clear)
+
+    def get_connection(self):
+        with connection_pool.connection() as connection:
+            return connection
+
+    def test_connection_is_reused(self):
+        send_messages(get_messages(1))
+        send_messages(get_messages(1))
+
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(len(connection_pool), 1)
+        self.assertIs(self.get_connection(), self.get_connection())
+
+    @override_settings(ALDRYN_FORMS_SMTP_POOL_SIZE=0)
+    def test_disabled(self):
+        self.assertIsNot(self.get_connection(), self.get_connection())
+        self.assertEqual(len(connection_pool), 0)
+
+    def test_size(self):
+        with connection_pool.connection() as first:
+            with connection_pool.connection() as second:
+                self.assertIsNot(first, second)
+
+        # The connection released first is kept.
+        self.assertEqual(len(connection_pool), 1)
+        self.assertIs(self.get_connection(), second)
+
+    @override_settings(ALDRYN_FORMS_SMTP_POOL_IDLE_TIMEOUT=0)
+    def test_idle_timeout(self):
+        connection = self.get_connection()
+
+        with mock.patch.object(connection, 'close') as close:
+            self.assertIsNot(self.get_connection(), connection)
+
+        close.assert_called_once()
+
+    def test_health_check(self):
+        connection = mock.Mock()
+        connection.connection.noop.return_value = (421, b'Service not available')
+        connection_pool.release(connection)
+
+        self.assertIsNot(self.get_connection(), connection)
+        connection.close.assert_called_once()
+
+        connection_pool.clear()
+        connection = mock.Mock()
+        connection.connection.noop.return_value = (250, b'OK')
+        connection_pool.release(connection)
+
+        self.assertIs(self.get_connection(), connection)
+
+    def test_failed_connection_is_dropped(self):
+        with self.assertRaises(smtplib.SMTPServerDisconnected):
+            with connection_pool.connection():
+                raise smtplib.SMTPServerDisconnected()
+
+        self.assertEqual(len(connection_pool), 0)
+
+    def test_cleared_on_email_setting_change(self):
+        self.get_connection()
+
+        with self.settings(EMAIL_HOST='mail.example.com'):
+            self.assertEqual(len(connection_pool), 0)
+
+
+class CollectMessagesTestCase(CMSTestCase):
+
+    def create_form(self, action_backend='email_only'):
+        page = create_page('test page', 'test_page.html', 'en')
+        if CMS_3_11:
+            placeholder = page.placeholders.get(slot='content')
+        else:
+            placeholder = page.pagecontent_set.get().placeholders.get(slot='content')
+
+        form_plugin = add_plugin(placeholder, 'FormPlugin', 'en', name='form', action_backend=action_backend)
+        form_plugin.recipients.add(User.objects.create_user('staff', 'staff@example.com', 'password'))
+        for name in ('email', 'other_email'):
+            add_plugin(
+                placeholder, 'EmailField', 'en', target=form_plugin, name=name,
+                email_send_notification=True, email_subject=f'Thank you {name}',
+            )
+        add_plugin(placeholder, 'SubmitButton', 'en', target=form_plugin, label='Submit')
+
+        if CMS_3_11:
+            page.publish('en')
+            form_plugin = page.publisher_public.placeholders.get(slot='content').cmsplugin_set.get(
+                plugin_type='FormPlugin',
+            )
+        return page, form_plugin
+
+    def test_sent_together_after_commit(self):
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages') as send:
+            with self.captureOnCommitCallbacks(execute=True):
+                with collect_messages(form_name='form') as messages:
+                    send_messages(get_messages(1))
+                    send_messages(get_messages(2))
+
+                self.assertEqual(len(messages), 3)
+                send.assert_not_called()
+
+        send.assert_called_once_with(messages)
+
+    def test_nothing_sent_on_error(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertRaises(ValueError):
+                with collect_messages():
+                    send_messages(get_messages())
+                    raise ValueError
+
+        self.assertEqual(callbacks, [])
+        self.assertEqual(mail.outbox, [])
+
+    @mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages')
+    def test_failures_are_reported_once(self, send):
+        send.side_effect = smtplib.SMTPServerDisconnected('gone')
+
+        with self.assertLogs('aldryn_forms.mail', 'ERROR') as logs:
+            with self.captureOnCommitCallbacks(execute=True):
+                with collect_messages(form_name='form'):
+                    send_messages(get_messages())
+
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn(
+            '2 emails of form "form": "subject 0" to user0@example.com, "subject 1" to user1@example.com. gone',
+            logs.records[0].getMessage(),
+        )
+
+    @override_settings(ALDRYN_FORMS_EMAIL_OUTBOX=True)
+    def test_outbox(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            with collect_messages(form_name='form'):
+                send_messages(get_messages())
+
+        self.assertEqual(callbacks, [])
+        self.assertEqual(list(OutboxEmail.objects.values_list('form_name', flat=True)), ['form', 'form'])
+
+    def test_form_submission(self):
+        page, form_plugin = self.create_form()
+
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages') as send:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(page.get_absolute_url('en'), {
+                    'form_plugin_id': form_plugin.id,
+                    'email': 'test@example.com',
+                    'other_email': 'other@example.com',
+                })
+
+        send.assert_called_once()
+        self.assertEqual(
+            [(message.subject, message.to) for message in send.call_args.args[0]],
+            [
+                ('[Form submission] form', ['staff@example.com']),
+                ('Thank you email', ['test@example.com']),
+                ('Thank you other_email', ['other@example.com']),
+            ],
+        )
+
+    @mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages')
+    def test_intended_recipients_are_saved(self, send):
+        send.side_effect = smtplib.SMTPServerDisconnected('gone')
+        page, form_plugin = self.create_form(action_backend='default')
+
+        with self.assertLogs('aldryn_forms.mail', 'ERROR') as logs:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(page.get_absolute_url('en'), {
+                    'form_plugin_id': form_plugin.id,
+                    'email': 'test@example.com',
+                    'other_email': 'other@example.com',
+                })
+
+        self.assertEqual(len(logs.records), 1)
+        submission = FormSubmission.objects.get()
+        self.assertEqual([recipient.email for recipient in submission.get_recipients()], ['staff@example.com'])
@@ -0,0 +1,184 @@
+import re
+from unittest import mock
+
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, modify_settings, override_settings
+
+from cms.api import add_plugin, create_page
+from cms.models import Placeholder
+from cms.test_utils.testcases import CMSTestCase
+
+from aldryn_forms.cms_plugins import FormPlugin
+from aldryn_forms.constants import ALDRYN_FORMS_CSRF_TOKEN_MARKER
+from aldryn_forms.middleware.cacheable_forms import limit_page_cache_ttl
+from aldryn_forms.middleware.handle_post import HandleHttpPost
+from tests.test_views import CMS_3_11
+
+
+class HandleHttpPostTestCase(CMSTestCase):
+
+    def setUp(self):
+        self.middleware = HandleHttpPost(lambda request: HttpResponse())
+        placeholder = Placeholder.objects.create(slot='test')
+        self.form_plugin = add_plugin(
+            placeholder, 'FormPlugin', 'en', redirect_type='redirect_to_url', url='https://example.com/thanks/',
+        )
+        add_plugin(placeholder, 'SubmitButton', 'en', target=self.form_plugin, label='Submit')
+
+    def process_view(self, request):
+        return self.middleware.process_view(request, None, (), {})
+
+    def post(self, path='/contact/', **kwargs):
+        return RequestFactory().post(path, {'form_plugin_id': self.form_plugin.pk}, **kwargs)
+
+    def test_form_submission_is_redirected(self):
+        response = self.process_view(self.post())
+
+        self.assertEqual(response.status_code, 303)
+        self.assertEqual(response['Location'], 'https://example.com/thanks/')
+
+    def test_form_without_success_url_is_redirected_to_submitted_page(self):
+        self.form_plugin.redirect_type = ''
+        self.form_plugin.save()
+
+        response = self.process_view(self.post('/contact/?source=ad'))
+
+        self.assertEqual(response.status_code, 303)
+        self.assertEqual(
+            response['Location'], '/contact/?source=ad&aldryn_forms_success={}'.format(self.form_plugin.pk))
+
+    def test_form_submitted_while_rendering_is_redirected(self):
+        request = self.post()
+        response = HttpResponse()
+        self.assertIs(self.middleware.process_response(request, response), response)
+
+        request._aldryn_forms_success_redirect_url = 'https://example.com/thanks/'
+        response = self.middleware.process_response(request, response)
+
+        self.assertEqual(response.status_code, 303)
+        self.assertEqual(response['Location'], 'https://example.com/thanks/')
+
+    def test_other_content_types_are_not_parsed(self):
+        request = RequestFactory().post('/api/items/', '{"form_plugin_id": 1}', content_type='application/json')
+
+        with self.assertNumQueries(0):
+            self.assertIsNone(self.process_view(request))
+        self.assertFalse(hasattr(request, '_post'))
+
+    @override_settings(ALDRYN_FORMS_HANDLE_POST_EXCLUDED_PATHS=[r'/api/'])
+    def test_excluded_paths(self):
+        request = self.post('/api/items/')
+
+        self.assertIsNone(self.process_view(request))
+        self.assertFalse(hasattr(request, '_post'))
+        self.assertIsNotNone(self.process_view(self.post()))
+
+    @override_settings(ALDRYN_FORMS_HANDLE_POST_PATHS=[r'/contact/'])
+    def test_paths(self):
+        request = self.post('/api/items/')
+
+        self.assertIsNone(self.process_view(request))
+        self.assertFalse(hasattr(request, '_post'))
+        self.assertIsNotNone(self.process_view(self.post()))
+
+
+@override_settings(ALDRYN_FORMS_CACHEABLE_RENDER=True, CMS_PAGE_CACHE=False)
+@modify_settings(MIDDLEWARE={'append': 'aldryn_forms.middleware.cacheable_forms.CacheableForms'})
+class CacheableFormsTestCase(CMSTestCase):
+
+    def setUp(self):
+        cache.clear()
+        page = create_page('contact', 'test_page.html', 'en')
+        if CMS_3_11:
+            placeholder = page.placeholders.get(slot='content')
+        else:
+            placeholder = page.pagecontent_set.get().placeholders.get(slot='content')
+        self.form_plugin = add_plugin(placeholder, 'FormPlugin', 'en', action_backend='none')
+        add_plugin(placeholder, 'TextField', 'en', target=self.form_plugin, name='name', label='Name', required=True)
+        add_plugin(placeholder, 'SubmitButton', 'en', target=self.form_plugin, label='Submit')
+        if CMS_3_11:
+            page.publish('en')
+            self.form_plugin = FormPlugin.model.objects.get(
+                placeholder__page=page.publisher_public, placeholder__slot='content')
+        self.url = page.get_absolute_url('en')
+
+    def get_csrf_token(self, response):
+        return re.search(r'name="csrfmiddlewaretoken" value="([^"]+)"', response.content.decode()).group(1)
+
+    def test_form_is_served_from_placeholder_cache(self):
+        client = Client(enforce_csrf_checks=True)
+
+        with mock.patch.object(FormPlugin, 'render', side_effect=FormPlugin.render, autospec=True) as render:
+            self.client.get(self.url)
+            response = client.get(self.url)
+
+        self.assertEqual(render.call_count, 1)
+        self.assertNotContains(response, ALDRYN_FORMS_CSRF_TOKEN_MARKER)
+
+        response = client.post(self.url, {
+            'csrfmiddlewaretoken': self.get_csrf_token(response),
+            'form_plugin_id': self.form_plugin.pk,
+            'name': 'Jane',
+        })
+        self.assertEqual(response.status_code, 200)
+
+    def test_submission_is_not_served_from_cache(self):
+        self.client.get(self.url)
+
+        with mock.patch.object(FormPlugin, 'render', side_effect=FormPlugin.render, autospec=True) as render:
+            response = self.client.post(self.url, {'form_plugin_id': self.form_plugin.pk, 'name': ''})
+
+        self.assertEqual(render.call_count, 1)
+        self.assertContains(response, 'This field is required.')
+
+    @override_settings(ALDRYN_FORMS_CACHEABLE_RENDER=False)
+    def test_form_is_not_cached_by_default(self):
+        with mock.patch.object(FormPlugin, 'render', side_effect=FormPlugin.render, autospec=True) as render:
+            self.client.get(self.url)
+            response = self.client.get(self.url)
+
+        self.assertEqual(render.call_count, 2)
+        self.assertNotContains(response, ALDRYN_FORMS_CSRF_TOKEN_MARKER)
+
+    def test_limit_page_cache_ttl(self):
+        response = self.client.get(self.url)
+        response.content = response.content.replace(
+            self.get_csrf_token(response).encode(), ALDRYN_FORMS_CSRF_TOKEN_MARKER.encode())
+
+        self.assertEqual(limit_page_cache_ttl(response), 0)
+        self.assertIsNone(limit_page_cache_ttl(HttpResponse('<p>No form</p>')))
+
+
+@modify_settings(MIDDLEWARE={'append': 'aldryn_forms.middleware.handle_post.HandleHttpPost'})
+class PostRedirectGetTestCase(CMSTestCase):
+
+    def setUp(self):
+        page = create_page('contact', 'test_page.html', 'en')
+        if CMS_3_11:
+            placeholder = page.placeholders.get(slot='content')
+        else:
+            placeholder = page.pagecontent_set.get().placeholders.get(slot='content')
+        self.form_plugin = add_plugin(placeholder, 'FormPlugin', 'en', action_backend='none')
+        add_plugin(placeholder, 'SubmitButton', 'en', target=self.form_plugin, label='Submit')
+        if CMS_3_11:
+            page.publish('en')
+            self.form_plugin = FormPlugin.model.objects.get(
+                placeholder__page=page.publisher_public, placeholder__slot='content')
+        self.url = page.get_absolute_url('en')
+
+    def test_success_message_is_shown_after_redirect(self):
+        with mock.patch.object(FormPlugin, 'render', side_effect=FormPlugin.render, autospec=True) as render:
+            response = self.client.post(self.url, {'form_plugin_id': self.form_plugin.pk})
+
+        self.assertEqual(render.call_count, 0)
+        self.assertRedirects(response, '{}?aldryn_forms_success={}'.format(self.url, self.form_plugin.pk), 303)
+
+        response = self.client.get(response['Location'])
+        self.assertContains(response, 'Thank you for submitting your information.')
+
+    @override_settings(ALDRYN_FORMS_HANDLE_POST_EXCLUDED_PATHS=[r'/'])
+    def test_form_submitted_while_rendering_is_redirected(self):
+        response = self.client.post(self.url, {'form_plugin_id': self.form_plugin.pk})
+
+        self.assertRedirects(response, '{}?aldryn_forms_success={}'.format(self.url, self.form_plugin.pk), 303)
@@ -1,3 +1,5 @@
+from unittest import mock
+
 from django.core.exceptions import ValidationError
 from django.db import IntegrityError
 from django.test import TestCase
@@ -7,7 +9,11 @@ from cms.models import Placeholder
 
 from filer.models import Folder
 
-from aldryn_forms.models import FileUploadFieldPlugin, ImageUploadFieldPlugin, MultipleFilesUploadFieldPlugin, Option
+from aldryn_forms.action_backends import NoAction
+from aldryn_forms.models import (
+    EmailFieldPlugin, FileUploadFieldPlugin, FormPlugin, ImageUploadFieldPlugin, MultipleFilesUploadFieldPlugin, Option,
+)
+from aldryn_forms.utils import get_plugin_tree
 
 
 class OptionTestCase(TestCase):
@@ -148,3 +154,138 @@ class ImageUploadFieldPluginTest(TestCase):
         field = ImageUploadFieldPlugin(enable_js=True)
         self.assertTrue(field.enable_js)
         self.assertIsNone(field.max_size)
+
+
+class FormFieldIndexTestCase(TestCase):
+
+    def setUp(self):
+        self.placeholder = Placeholder.objects.create(slot='test')
+        self.form_plugin = add_plugin(self.placeholder, 'FormPlugin', 'en', name='form')
+        self.fields = [
+            add_plugin(self.placeholder, 'TextField', 'en', target=self.form_plugin, name='name')
+            for _ in range(3)
+        ]
+        self.email = add_plugin(self.placeholder, 'EmailField', 'en', target=self.form_plugin)
+
+    def test_unique_field_names(self):
+        form_plugin = get_plugin_tree(FormPlugin, pk=self.form_plugin.pk)
+
+        self.assertEqual(
+            [field.name for field in form_plugin.get_form_fields()],
+            ['name', 'name_', 'name__', 'emailfield_1'],
+        )
+
+    def test_lookups(self):
+        form_plugin = get_plugin_tree(FormPlugin, pk=self.form_plugin.pk)
+
+        index = form_plugin.get_form_field_index()
+
+        self.assertEqual(len(index), 4)
+        self.assertEqual(index.get_name(self.fields[1].pk), 'name_')
+        self.assertEqual(index.get_plugin_instance('emailfield_1').pk, self.email.pk)
+
+    def test_field_names_are_computed_once(self):
+        form_plugin = get_plugin_tree(FormPlugin, pk=self.form_plugin.pk)
+
+        with mock.patch.object(FormPlugin, 'compile_form', wraps=form_plugin.compile_form) as compile_form:
+            names = [form_plugin.get_form_field_name(field) for field in self.fields + [self.email]]
+
+        self.assertEqual(names, ['name', 'name_', 'name__', 'emailfield_1'])
+        compile_form.assert_called_once()
+
+
+class CompiledFormTestCase(TestCase):
+
+    def setUp(self):
+        self.placeholder = Placeholder.objects.create(slot='test')
+        self.column = add_plugin(self.placeholder, 'TextPlugin', 'en', body='column')
+        self.form_plugin = add_plugin(self.placeholder, 'FormPlugin', 'en', target=self.column, name='form')
+        fieldset = add_plugin(self.placeholder, 'Fieldset', 'en', target=self.form_plugin, legend='fieldset')
+        add_plugin(self.placeholder, 'TextField', 'en', target=fieldset, name='name')
+        self.submit = add_plugin(self.placeholder, 'SubmitButton', 'en', target=self.form_plugin, label='Submit')
+
+    def test_compiled_form(self):
+        form_plugin = get_plugin_tree(FormPlugin, pk=self.form_plugin.pk)
+
+        compiled_form = form_plugin.get_compiled_form()
+
+        self.assertEqual(
+            [element.plugin_type for element in compiled_form.elements],
+            ['Fieldset', 'TextField', 'SubmitButton'],
+        )
+        self.assertEqual([field.name for field in compiled_form.fields], ['name'])
+        self.assertEqual(compiled_form.submit_button.pk, self.submit.pk)
+        self.assertIs(form_plugin.get_compiled_form(), compiled_form)
+
+    def test_plugin_instance_is_not_modified(self):
+        form_plugin = FormPlugin.objects.get(pk=self.form_plugin.pk)
+
+        compiled_form = form_plugin.get_compiled_form()
+
+        self.assertEqual([field.name for field in compiled_form.fields], ['name'])
+        self.assertIsNone(form_plugin.child_plugin_instances)
+        self.assertEqual(form_plugin.parent_id, self.column.pk)
+
+
+class EmailFieldParentFormTestCase(TestCase):
+
+    def setUp(self):
+        self.placeholder = Placeholder.objects.create(slot='test')
+        self.form_plugin = add_plugin(self.placeholder, 'FormPlugin', 'en', name='form', action_backend='none')
+
+    def test_direct_child(self):
+        email = add_plugin(self.placeholder, 'EmailField', 'en', target=self.form_plugin)
+
+        parent, action_backend = email.get_parent_form_action_backend()
+
+        self.assertIsInstance(parent, FormPlugin)
+        self.assertEqual(parent.pk, self.form_plugin.pk)
+        self.assertIs(action_backend, NoAction)
+
+    def test_nested_fieldsets(self):
+        fieldset = add_plugin(self.placeholder, 'Fieldset', 'en', target=self.form_plugin)
+        nested_fieldset = add_plugin(self.placeholder, 'Fieldset', 'en', target=fieldset)
+        email = add_plugin(self.placeholder, 'EmailField', 'en', target=nested_fieldset)
+
+        with self.assertNumQueries(2):
+            parent = email.get_parent_form()
+
+        self.assertEqual(parent.pk, self.form_plugin.pk)
+        self.assertEqual(email.get_parent_form_action_backend(), (parent, NoAction))
+
+    def test_resolved_once(self):
+        fieldset = add_plugin(self.placeholder, 'Fieldset', 'en', target=self.form_plugin)
+        email = add_plugin(self.placeholder, 'EmailField', 'en', target=fieldset)
+        email.get_parent_form()
+
+        with self.assertNumQueries(0):
+            parent = email.get_parent_form()
+
+        self.assertEqual(parent.pk, self.form_plugin.pk)
+
+    def test_outside_of_form(self):
+        text = add_plugin(self.placeholder, 'TextPlugin', 'en', body='column')
+        email = add_plugin(self.placeholder, 'EmailField', 'en', target=text)
+
+        self.assertIsNone(email.get_parent_form())
+        self.assertEqual(email.get_parent_form_action_backend(), (None, None))
+
+    def test_aliased_field(self):
+        source_placeholder = Placeholder.objects.create(slot='source')
+        email = add_plugin(source_placeholder, 'EmailField', 'en')
+        fieldset = add_plugin(self.placeholder, 'Fieldset', 'en', target=self.form_plugin)
+        add_plugin(self.placeholder, 'AliasPlugin', 'en', target=fieldset, plugin=email)
+
+        self.assertEqual(email.get_parent_form().pk, self.form_plugin.pk)
+
+    def test_mutually_aliased_placeholders(self):
+        placeholder = Placeholder.objects.create(slot='other')
+        add_plugin(self.placeholder, 'AliasPlugin', 'en', alias_placeholder=placeholder)
+        add_plugin(placeholder, 'AliasPlugin', 'en', alias_placeholder=self.placeholder)
+        email = add_plugin(placeholder, 'EmailField', 'en')
+
+        self.assertIsNone(email.get_parent_form())
+
+        email.delete()
+
+        self.assertFalse(EmailFieldPlugin.objects.filter(pk=email.pk).exists())
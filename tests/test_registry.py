@@ -0,0 +1,80 @@
+from unittest import skipUnless
+
+from django.contrib.auth.models import AnonymousUser, User
+from django.test import RequestFactory
+
+from cms.api import add_plugin, create_page
+from cms.models import Placeholder
+from cms.test_utils.testcases import CMSTestCase
+
+from aldryn_forms.models import FormRegistryEntry
+from aldryn_forms.registry import can_submit_form, get_form_registry_entry
+from tests.test_views import CMS_3_11
+
+
+class FormRegistryTestCase(CMSTestCase):
+
+    def setUp(self):
+        self.page = create_page('test page', 'test_page.html', 'en')
+        if CMS_3_11:
+            self.placeholder = self.page.placeholders.get(slot='content')
+        else:  # 4.1
+            self.placeholder = self.page.pagecontent_set.get().placeholders.get(slot='content')
+        self.form_plugin = add_plugin(self.placeholder, 'FormPlugin', 'en', name='form')
+
+    def get_public_form_plugin(self):
+        placeholder = self.page.publisher_public.placeholders.get(slot='content')
+        return placeholder.cmsplugin_set.get(plugin_type='FormPlugin')
+
+    def test_form_plugins_are_registered(self):
+        entry = FormRegistryEntry.objects.get(form_plugin_id=self.form_plugin.pk)
+
+        self.assertEqual(entry.placeholder_id, self.placeholder.pk)
+        self.assertEqual(entry.page_id, self.page.pk)
+        self.assertEqual(entry.language, 'en')
+        self.assertEqual(entry.is_published, not CMS_3_11)
+
+        add_plugin(self.placeholder, 'TextField', 'en', target=self.form_plugin, name='name')
+        self.assertEqual(FormRegistryEntry.objects.count(), 1)
+
+    def test_form_plugins_outside_pages(self):
+        placeholder = Placeholder.objects.create(slot='test')
+        form_plugin = add_plugin(placeholder, 'FormPlugin', 'en', name='form')
+
+        self.assertIsNone(FormRegistryEntry.objects.get(form_plugin_id=form_plugin.pk).page_id)
+
+    @skipUnless(CMS_3_11, 'django CMS 4 leaves publishing to djangocms-versioning')
+    def test_publishing(self):
+        self.page.publish('en')
+        public_form_plugin = self.get_public_form_plugin()
+
+        self.assertTrue(FormRegistryEntry.objects.get(form_plugin_id=public_form_plugin.pk).is_published)
+        self.assertFalse(FormRegistryEntry.objects.get(form_plugin_id=self.form_plugin.pk).is_published)
+
+        self.page.unpublish('en')
+
+        self.assertFalse(FormRegistryEntry.objects.get(form_plugin_id=public_form_plugin.pk).is_published)
+
+    def test_unregistered_form_plugins_are_registered_on_lookup(self):
+        FormRegistryEntry.objects.all().delete()
+
+        self.assertEqual(get_form_registry_entry(self.form_plugin.pk).page_id, self.page.pk)
+        self.assertIsNone(get_form_registry_entry(self.form_plugin.pk + 1000))
+
+        text_plugin = add_plugin(self.placeholder, 'TextPlugin', 'en', body='text')
+        self.assertIsNone(get_form_registry_entry(text_plugin.pk))
+
+    def test_deleted_form_plugins_are_unregistered(self):
+        self.form_plugin.delete()
+
+        self.assertFalse(FormRegistryEntry.objects.exists())
+
+    @skipUnless(CMS_3_11, 'django CMS 4 leaves publishing to djangocms-versioning')
+    def test_only_staff_can_submit_unpublished_forms(self):
+        request = RequestFactory().post('/')
+        request.user = AnonymousUser()
+
+        self.assertFalse(can_submit_form(request, self.form_plugin.pk))
+
+        request.user = User.objects.create_user('staff', is_staff=True)
+        self.assertTrue(can_submit_form(request, self.form_plugin.pk))
@@ -1,11 +1,22 @@
 from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
 from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 
+from cms.api import add_plugin
+from cms.models import CMSPlugin, Placeholder
 from cms.test_utils.testcases import CMSTestCase
 
+from filer.models import Folder
+
 from aldryn_forms.action_backends import DefaultAction, EmailAction, NoAction
 from aldryn_forms.action_backends_base import BaseAction
-from aldryn_forms.utils import action_backend_choices, get_action_backends
+from aldryn_forms.models import EmailFieldPlugin, FieldsetPlugin, FormButtonPlugin, FormPlugin
+from aldryn_forms.utils import (
+    action_backend_choices, downcast_form_plugins, get_action_backends, get_nested_plugins, get_plugin_tree,
+    prefetch_form_elements,
+)
+from tests.test_views import CMS_3_11
 
 
 class FakeValidBackend(BaseAction):
@@ -127,3 +138,195 @@ class ActionChoicesTestCase(CMSTestCase):
         choices = action_backend_choices()
 
         self.assertEqual(choices, expected)
+
+
+class GetPluginTreeTestCase(CMSTestCase):
+
+    def setUp(self):
+        self.placeholder = Placeholder.objects.create(slot='test')
+
+    def create_form(self, depth):
+        form_plugin = add_plugin(self.placeholder, 'FormPlugin', 'en', name='form')
+        parent = form_plugin
+        for level in range(depth):
+            parent = add_plugin(self.placeholder, 'Fieldset', 'en', target=parent, legend=f'level {level}')
+            add_plugin(self.placeholder, 'TextField', 'en', target=parent, name=f'text_{level}')
+            add_plugin(self.placeholder, 'EmailField', 'en', target=parent, name=f'email_{level}')
+        add_plugin(self.placeholder, 'SubmitButton', 'en', target=form_plugin, label='Submit')
+        return form_plugin
+
+    def test_tree(self):
+        form_plugin = self.create_form(depth=2)
+
+        tree = get_plugin_tree(FormPlugin, pk=form_plugin.pk)
+
+        self.assertEqual(tree.pk, form_plugin.pk)
+        fieldset, submit = tree.child_plugin_instances
+        self.assertIsInstance(fieldset, FieldsetPlugin)
+        self.assertIsInstance(submit, FormButtonPlugin)
+        text, email, nested_fieldset = fieldset.child_plugin_instances
+        self.assertEqual(text.name, 'text_0')
+        self.assertIsInstance(email, EmailFieldPlugin)
+        self.assertEqual(
+            [plugin.name for plugin in nested_fieldset.child_plugin_instances],
+            ['text_1', 'email_1'],
+        )
+
+    def test_query_count_does_not_depend_on_depth(self):
+        flat_form = self.create_form(depth=1)
+        deep_form = self.create_form(depth=5)
+
+        with CaptureQueriesContext(connection) as flat_queries:
+            get_plugin_tree(FormPlugin, pk=flat_form.pk)
+        with CaptureQueriesContext(connection) as deep_queries:
+            get_plugin_tree(FormPlugin, pk=deep_form.pk)
+
+        self.assertEqual(len(flat_queries), len(deep_queries))
+
+
+class DowncastFormPluginsTestCase(CMSTestCase):
+
+    def setUp(self):
+        self.placeholder = Placeholder.objects.create(slot='test')
+        self.form_plugin = add_plugin(self.placeholder, 'FormPlugin', 'en', name='form')
+        self.folder = Folder.objects.create(name='uploads')
+
+    def test_one_query_per_plugin_type(self):
+        for index in range(3):
+            add_plugin(self.placeholder, 'TextField', 'en', target=self.form_plugin, name=f'text_{index}')
+            add_plugin(self.placeholder, 'EmailField', 'en', target=self.form_plugin, name=f'email_{index}')
+            add_plugin(self.placeholder, 'FileField', 'en', target=self.form_plugin, upload_to=self.folder)
+        plugins = list(CMSPlugin.objects.filter(parent=self.form_plugin))
+
+        with self.assertNumQueries(3):
+            instances = downcast_form_plugins(plugins)
+            folders = [instance.upload_to for instance in instances if instance.plugin_type == 'FileField']
+
+        self.assertEqual([instance.pk for instance in instances], [plugin.pk for plugin in plugins])
+        self.assertEqual(folders, [self.folder] * 3)
+
+    def test_already_downcasted_plugins_are_kept(self):
+        field = add_plugin(self.placeholder, 'TextField', 'en', target=self.form_plugin, name='text')
+
+        with self.assertNumQueries(0):
+            instances = downcast_form_plugins([field])
+
+        self.assertIs(instances[0], field)
+
+    def test_alias_target(self):
+        source_placeholder = Placeholder.objects.create(slot='source')
+        source = add_plugin(source_placeholder, 'EmailField', 'en', name='shared_email')
+        add_plugin(self.placeholder, 'AliasPlugin', 'en', target=self.form_plugin, plugin=source)
+        plugins = list(CMSPlugin.objects.filter(parent=self.form_plugin))
+
+        alias, = downcast_form_plugins(plugins)
+
+        with self.assertNumQueries(0):
+            self.assertIsInstance(alias.plugin, EmailFieldPlugin)
+            self.assertEqual(alias.plugin.get_plugin_instance()[0].name, 'shared_email')
+
+
+class GetNestedPluginsTestCase(CMSTestCase):
+
+    def setUp(self):
+        self.placeholder = Placeholder.objects.create(slot='test')
+        self.source_placeholder = Placeholder.objects.create(slot='source')
+        self.consent = add_plugin(self.source_placeholder, 'Fieldset', 'en', legend='consent')
+        add_plugin(self.source_placeholder, 'BooleanField', 'en', target=self.consent, name='gdpr')
+        add_plugin(self.source_placeholder, 'TextField', 'en', target=self.consent, name='signature')
+        self.email = add_plugin(self.source_placeholder, 'EmailField', 'en', name='email')
+
+        self.form_plugin = add_plugin(self.placeholder, 'FormPlugin', 'en', name='form')
+        add_plugin(self.placeholder, 'TextField', 'en', target=self.form_plugin, name='name')
+        add_plugin(self.placeholder, 'AliasPlugin', 'en', target=self.form_plugin, plugin=self.consent)
+        add_plugin(self.placeholder, 'AliasPlugin', 'en', target=self.form_plugin, plugin=self.email)
+        add_plugin(self.placeholder, 'AliasPlugin', 'en', target=self.form_plugin, plugin=self.consent)
+        add_plugin(self.placeholder, 'SubmitButton', 'en', target=self.form_plugin, label='Submit')
+
+    def test_aliases_are_replaced_by_aliased_plugins(self):
+        form_plugin = get_plugin_tree(FormPlugin, pk=self.form_plugin.pk)
+
+        with CaptureQueriesContext(connection) as queries:
+            nested_plugins = get_nested_plugins(form_plugin)
+
+        if CMS_3_11:
+            # All aliased plugins are loaded with a single query.
+            self.assertEqual(len(queries), 1)
+
+        self.assertEqual(
+            [plugin.plugin_type for plugin in nested_plugins],
+            ['TextField', 'Fieldset', 'BooleanField', 'TextField', 'EmailField', 'SubmitButton'],
+        )
+        self.assertEqual(
+            [field.name for field in form_plugin.get_form_fields()],
+            ['name', 'gdpr', 'signature', 'email'],
+        )
+
+    def test_aliased_placeholder(self):
+        form_plugin = add_plugin(self.placeholder, 'FormPlugin', 'en', name='placeholder alias')
+        add_plugin(self.placeholder, 'AliasPlugin', 'en', target=form_plugin, alias_placeholder=self.source_placeholder)
+        form_plugin = get_plugin_tree(FormPlugin, pk=form_plugin.pk)
+
+        self.assertEqual(
+            [field.name for field in form_plugin.get_form_fields()],
+            ['gdpr', 'signature', 'email'],
+        )
+
+
+class PrefetchFormElementsTestCase(CMSTestCase):
+
+    def setUp(self):
+        self.placeholder = Placeholder.objects.create(slot='test')
+        self.source_placeholder = Placeholder.objects.create(slot='source')
+        self.email = add_plugin(self.source_placeholder, 'EmailField', 'en', name='email')
+
+    def create_form(self, name):
+        form_plugin = add_plugin(self.placeholder, 'FormPlugin', 'en', name=name)
+        fieldset = add_plugin(self.placeholder, 'Fieldset', 'en', target=form_plugin, legend='fieldset')
+        add_plugin(self.placeholder, 'TextField', 'en', target=fieldset, name=f'{name}_text')
+        select = add_plugin(self.placeholder, 'SelectField', 'en', target=form_plugin, name=f'{name}_select')
+        select.option_set.create(value='one')
+        add_plugin(self.placeholder, 'AliasPlugin', 'en', target=form_plugin, plugin=self.email)
+        add_plugin(self.placeholder, 'SubmitButton', 'en', target=form_plugin, label='Submit')
+        return form_plugin
+
+    def prefetch(self, form_plugins):
+        form_plugins = list(FormPlugin.objects.filter(pk__in=[plugin.pk for plugin in form_plugins]).order_by('pk'))
+
+        with CaptureQueriesContext(connection) as queries:
+            prefetch_form_elements(form_plugins)
+        return form_plugins, queries
+
+    def test_form_elements(self):
+        form_plugin = self.create_form('form')
+
+        (prefetched_form,), _ = self.prefetch([form_plugin])
+        expected = get_plugin_tree(FormPlugin, pk=form_plugin.pk).get_form_elements()
+
+        with self.assertNumQueries(0):
+            form_elements = prefetched_form.get_form_elements()
+            options = [option.value for option in form_elements[2].option_set.all()]
+
+        self.assertEqual([plugin.pk for plugin in form_elements], [plugin.pk for plugin in expected])
+        self.assertEqual(options, ['one'])
+        self.assertEqual(
+            [field.name for field in prefetched_form.get_form_fields()],
+            ['form_text', 'form_select', 'email'],
+        )
+
+    def test_query_count_does_not_depend_on_number_of_forms(self):
+        one_form = [self.create_form('first')]
+        three_forms = [self.create_form(name) for name in ('second', 'third', 'fourth')]
+
+        _, one_form_queries = self.prefetch(one_form)
+        _, three_forms_queries = self.prefetch(three_forms)
+
+        self.assertEqual(len(one_form_queries), len(three_forms_queries))
+
+    def test_plugin_tree_is_kept(self):
+        form_plugin = get_plugin_tree(FormPlugin, pk=self.create_form('form').pk)
+        fieldset = form_plugin.child_plugin_instances[0]
+
+        prefetch_form_elements([form_plugin])
+
+        self.assertIs(form_plugin.get_form_elements()[0], fieldset)
@@ -1,5 +1,6 @@
 import sys
 from distutils.version import LooseVersion
+from unittest import mock
 
 from django.urls import clear_url_caches
 
@@ -8,6 +9,8 @@ from cms.api import add_plugin, create_page
 from cms.appresolver import clear_app_resolvers
 from cms.test_utils.testcases import CMSTestCase
 
+from aldryn_forms.constants import ALDRYN_FORMS_SUCCESS_PARAM
+
 
 # These means 'less than or equal'
 CMS_3_11 = LooseVersion(cms.__version__) < LooseVersion("4.0")
@@ -84,6 +87,13 @@ class SubmitFormViewTest(CMSTestCase):
             if module in sys.modules:
                 del sys.modules[module]
 
+    def get_published_plugin(self, plugin):
+        """Returns the copy of the plugin on the published page."""
+        if not CMS_3_11:
+            return plugin
+        placeholder = plugin.placeholder.page.publisher_public.placeholders.get(slot=plugin.placeholder.slot)
+        return placeholder.cmsplugin_set.get(plugin_type=plugin.plugin_type, position=plugin.position)
+
     def test_form_view_and_submission_with_apphook_django_gte_111(self):
         if CMS_3_11:
             public_page = self.page.publisher_public
@@ -107,7 +117,7 @@ class SubmitFormViewTest(CMSTestCase):
         response = self.client.post(self.page.get_absolute_url('en'), {
             'form_plugin_id': public_page_form_plugin.id,
         })
-        self.assertRedirects(response, self.redirect_url, fetch_redirect_response=False)  # noqa: E501
+        self.assertRedirects(response, self.redirect_url, status_code=303, fetch_redirect_response=False)
 
     def test_view_submit_one_form_instead_multiple(self):
         """Test checks if only one form is send instead of multiple on page together"""
@@ -180,10 +190,10 @@ class SubmitFormViewTest(CMSTestCase):
         self.apphook_clear()
 
         response = self.client.post(page.get_absolute_url('en'), {
-            'form_plugin_id': form_plugin2.id,
+            'form_plugin_id': self.get_published_plugin(form_plugin2).id,
             'email_1': 'test@test',
         })
-        self.assertRedirects(response, plugin_data2['url'], fetch_redirect_response=False)  # noqa: E501
+        self.assertRedirects(response, plugin_data2['url'], status_code=303, fetch_redirect_response=False)
 
     def test_view_submit_one_valid_form_instead_multiple(self):
         """Test checks if only one form is validated instead multiple on a page"""
@@ -257,10 +267,51 @@ class SubmitFormViewTest(CMSTestCase):
         self.apphook_clear()
 
         response = self.client.post(page.get_absolute_url('en'), {
-            'form_plugin_id': form_plugin2.id,
+            'form_plugin_id': self.get_published_plugin(form_plugin2).id,
             'email_2': 'test@test',
         })
 
         email_field = '<input type="email" name="{name}"'
         self.assertContains(response, email_field.format(name='email_1'))
         self.assertContains(response, email_field.format(name='email_2'))
+
+    def test_submitted_form_is_processed_once(self):
+        page = create_page('form without redirect', 'test_page.html', 'en', apphook='FormsApp')
+        if CMS_3_11:
+            placeholder = page.placeholders.get(slot='content')
+        else:
+            placeholder = page.pagecontent_set.get().placeholders.get(slot='content')
+
+        form_plugin = add_plugin(placeholder, 'FormPlugin', 'en', name='no redirect')
+        add_plugin(placeholder, 'EmailField', 'en', name='email', required=True, target=form_plugin)
+        add_plugin(placeholder, 'SubmitButton', 'en', target=form_plugin, label='Submit')
+
+        if CMS_3_11:
+            page.publish('en')
+            form_plugin = page.publisher_public.placeholders.get(slot='content').cmsplugin_set.get(
+                plugin_type='FormPlugin',
+            )
+        self.reload_urls()
+        self.apphook_clear()
+
+        with mock.patch('aldryn_forms.cms_plugins.FormPlugin.form_valid') as form_valid:
+            response = self.client.post(page.get_absolute_url('en'), {
+                'form_plugin_id': form_plugin.id,
+                'email': 'test@example.com',
+            })
+
+        # Forms without a success URL are redirected to the page showing their success message.
+        self.assertRedirects(
+            response,
+            f'{page.get_absolute_url("en")}?{ALDRYN_FORMS_SUCCESS_PARAM}={form_plugin.id}',
+            status_code=303,
+            fetch_redirect_response=False,
+        )
+        form_valid.assert_called_once()
+
+    def test_submission_of_unknown_form_is_rejected(self):
+        text_plugin = add_plugin(self.placeholder, 'TextPlugin', 'en', body='text')
+
+        for form_plugin_id in (text_plugin.id, 123456):
+            response = self.client.post(self.page.get_absolute_url('en'), {'form_plugin_id': form_plugin_id})
+            self.assertEqual(response.status_code, 400)